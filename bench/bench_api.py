@@ -0,0 +1,353 @@
+"""
+Endpoint benchmark: seeds a SQLite database and drives every route of
+src/app.py, reporting throughput, latency percentiles, SQL statements per
+request and peak RSS as JSON.
+
+    python bench/bench_api.py --planets 1000 --users 20 --favorites 10:1000
+    python bench/bench_api.py --gunicorn --workers 4 --output after.json
+    python bench/bench_api.py --baseline before.json --output after.json
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+# measure the API, not the per-client limits (bench_concurrency.py too, it imports this module)
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--characters", type=int, default=1000)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--favorites", default="10:1000", help="min:max favorites per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--only", help="comma separated scenario names")
+    parser.add_argument("--gunicorn", action="store_true", help="drive a real gunicorn server over HTTP")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database", help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to diff against")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    # nearest-rank
+    index = max(0, int(math.ceil(pct / 100.0 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def process_tree_peak_rss_kb(pid):
+    """VmHWM of a process and its children, from /proc (Linux only)."""
+    total = 0
+    pids = [pid]
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    for current in pids:
+        try:
+            with open("/proc/%d/status" % current) as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total or None
+
+
+def seed(app, args, rng):
+    from sqlalchemy import insert
+    from models import db, User, Planet, Character, Vehicle, Favorites
+    from counters import recount_favorites
+
+    low, high = (int(value) for value in args.favorites.split(":"))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(Planet), [
+            {"name": "Planet %d" % i, "climate": rng.choice(["arid", "temperate", "frozen"]),
+             "terrain": "desert", "population": str(rng.randint(0, 10 ** 9)), "diameter": str(rng.randint(1000, 20000))}
+            for i in range(args.planets)
+        ])
+        db.session.execute(insert(Character), [
+            {"name": "Character %d" % i, "gender": rng.choice(["male", "female", "n/a"]),
+             "eye_color": rng.choice(["blue", "brown", "red"]), "height": str(rng.randint(60, 250)),
+             "planet_id": rng.randint(1, args.planets) if args.planets else None}
+            for i in range(args.characters)
+        ])
+        db.session.execute(insert(Vehicle), [
+            {"name": "Vehicle %d" % i, "model": "Model %d" % i, "manufacturer": "Incom",
+             "vehicle_class": "starfighter", "cost_in_credits": str(rng.randint(1000, 10 ** 6))}
+            for i in range(args.vehicles)
+        ])
+        db.session.execute(insert(User), [
+            {"email": "user%d@example.com" % i, "user_name": "user%d" % i, "password": "secret", "is_active": True}
+            for i in range(args.users)
+        ])
+        favorites = []
+        targets = [("planet_id", args.planets), ("character_id", args.characters), ("vehicle_id", args.vehicles)]
+        for user_id in range(1, args.users + 1):
+            liked = set()
+            for _ in range(rng.randint(low, high)):
+                column, count = rng.choice(targets)
+                if count:
+                    liked.add((column, rng.randint(1, count)))
+            # one favorite per (user, target), as enforced by the unique indexes
+            favorites.extend({"user_id": user_id, column: target_id} for column, target_id in sorted(liked))
+        if favorites:
+            db.session.execute(insert(Favorites), favorites)
+            # Core inserts skip the counter hooks
+            recount_favorites(db.session.connection())
+        db.session.commit()
+    # favorite ids follow insertion order, keep their owner for the DELETE scenario
+    return [favorite["user_id"] for favorite in favorites]
+
+
+def scenarios(args, rng, favorite_owners):
+    """(name, method, path factory, body factory) for every route in src/app.py."""
+    counter = iter(range(10 ** 9))
+
+    def random_id(count):
+        return lambda: rng.randint(1, max(count, 1))
+
+    deletable = list(enumerate(favorite_owners, start=1))
+    rng.shuffle(deletable)
+
+    def delete_path():
+        favorite_id, user_id = deletable.pop() if deletable else (0, 1)
+        return "/favorite/%d/%d" % (favorite_id, user_id)
+
+    planet, character, vehicle, user = (random_id(args.planets), random_id(args.characters),
+                                        random_id(args.vehicles), random_id(args.users))
+    return [
+        ("sitemap", "GET", lambda: "/", None),
+        ("users_page", "GET", lambda: "/users", None),
+        ("user_one", "GET", lambda: "/user/%d" % user(), None),
+        ("user_favorites", "GET", lambda: "/user/%d/favorites" % user(), None),
+        ("planets_page", "GET", lambda: "/planets", None),
+        ("planets_all", "GET", lambda: "/planets?all=true", None),
+        ("planets_stream", "GET", lambda: "/planets?stream=true", None),
+        ("characters_page", "GET", lambda: "/characters", None),
+        ("characters_all", "GET", lambda: "/characters?all=true", None),
+        ("vehicles_page", "GET", lambda: "/vehicles", None),
+        ("vehicles_all", "GET", lambda: "/vehicles?all=true", None),
+        ("favorites_top", "GET", lambda: "/favorites/top?type=%s" % rng.choice(["planet", "character", "vehicle"]), None),
+        ("search", "GET", lambda: "/search?q=%s" % rng.choice(["arid", "temperate blue", "planet 12", "incom star"]), None),
+        ("planet_one", "GET", lambda: "/planet/%d" % planet(), None),
+        ("character_one", "GET", lambda: "/character/%d" % character(), None),
+        ("vehicle_one", "GET", lambda: "/vehicle/%d" % vehicle(), None),
+        ("user_create", "POST", lambda: "/user", lambda: {
+            "email": "bench%d@example.com" % next(counter), "user_name": "b%d" % next(counter),
+            "password": "secret", "is_active": True}),
+        ("planet_create", "POST", lambda: "/planet", lambda: {
+            "name": "Bench planet %d" % next(counter), "rotation_period": "24", "orbital_period": "364",
+            "diameter": "12500", "climate": "temperate", "gravity": "1", "terrain": "grass",
+            "surface_water": "40", "population": "1000"}),
+        ("characters_bulk_create", "POST", lambda: "/characters", lambda: [
+            {"name": "Bench character %d" % next(counter), "gender": "n/a"} for _ in range(100)]),
+        ("favorite_planet_add", "POST", lambda: "/favorite/planet/%d" % planet(), lambda: {"user_id": user()}),
+        ("favorite_character_add", "POST", lambda: "/favorite/character/%d" % character(), lambda: {"user_id": user()}),
+        ("favorite_vehicle_add", "POST", lambda: "/favorite/vehicle/%d" % vehicle(), lambda: {"user_id": user()}),
+        ("favorites_batch", "POST", lambda: "/user/%d/favorites" % user(), lambda: {
+            "add": [{"type": "planet", "id": planet()} for _ in range(10)],
+            "remove": [{"type": "vehicle", "id": vehicle()} for _ in range(10)]}),
+        ("favorite_delete", "DELETE", delete_path, None),
+        ("cache_stats", "GET", lambda: "/cache/stats", None),
+    ]
+
+
+class TestClientDriver:
+
+    def __init__(self, app, engine):
+        from sqlalchemy import event
+
+        self.client = app.test_client()
+        self.statements = 0
+
+        def count(*_):
+            self.statements += 1
+        event.listen(engine, "before_cursor_execute", count)
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        size = len(response.get_data())
+        return response.status_code, size
+
+    def rss_kb(self):
+        return peak_rss_kb()
+
+
+class HTTPDriver:
+
+    def __init__(self, args, database):
+        env = dict(os.environ, DATABASE_URL="sqlite:///" + database, SQL_STATS_HEADERS="1")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC,
+             "-b", "127.0.0.1:%d" % args.port, "-w", str(args.workers), "--log-level", "warning"],
+            env=env, cwd=ROOT
+        )
+        self.connection = http.client.HTTPConnection("127.0.0.1", args.port, timeout=60)
+        # counted by the server and reported in the X-DB-Queries header
+        self.statements = 0
+        deadline = time.time() + 30
+        while True:
+            try:
+                self.request("GET", "/", None)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                self.connection.close()
+                time.sleep(0.2)
+
+    def request(self, method, path, body):
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        self.statements += int(response.getheader("X-DB-Queries", 0))
+        size = len(response.read())
+        return response.status, size
+
+    def rss_kb(self):
+        return process_tree_peak_rss_kb(self.process.pid)
+
+    def close(self):
+        self.connection.close()
+        self.process.terminate()
+        self.process.wait()
+
+
+def run_scenario(driver, method, path, body, count):
+    latencies = []
+    statuses = {}
+    total_bytes = 0
+    statements_before = driver.statements
+    started = time.perf_counter()
+    for _ in range(count):
+        request_started = time.perf_counter()
+        status, size = driver.request(method, path(), body() if body else None)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        total_bytes += size
+    elapsed = time.perf_counter() - started
+
+    statements = None
+    if statements_before is not None:
+        statements = (driver.statements - statements_before) / float(count)
+    return {
+        "requests": count,
+        "throughput_rps": round(count / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / count, 3),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+        },
+        "sql_per_request": statements,
+        "bytes_per_request": total_bytes // count,
+        "status": statuses,
+        "peak_rss_kb": driver.rss_kb(),
+    }
+
+
+def diff(report, baseline):
+    """Print the relative change of the headline numbers against baseline."""
+    previous = baseline.get("scenarios", {})
+    lines = []
+    for name, result in report["scenarios"].items():
+        before = previous.get(name)
+        if not before:
+            continue
+        changes = []
+        for label, now, then in (
+            ("rps", result["throughput_rps"], before["throughput_rps"]),
+            ("p50", result["latency_ms"]["p50"], before["latency_ms"]["p50"]),
+            ("p99", result["latency_ms"]["p99"], before["latency_ms"]["p99"]),
+            ("sql", result["sql_per_request"], before.get("sql_per_request")),
+        ):
+            if now is None or not then:
+                continue
+            changes.append("%s %+.1f%%" % (label, (now - then) * 100.0 / then))
+        lines.append("%-24s %s" % (name, "  ".join(changes)))
+    return "\n".join(lines)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = "sqlite:///" + database
+    sys.path.insert(0, SRC)
+
+    from app import app
+    from models import db
+
+    favorite_owners = seed(app, args, rng)
+    selected = set(args.only.split(",")) if args.only else None
+
+    if args.gunicorn:
+        driver = HTTPDriver(args, database)
+    else:
+        context = app.app_context()
+        context.push()
+        driver = TestClientDriver(app, db.engine)
+
+    report = {
+        "mode": "gunicorn" if args.gunicorn else "test_client",
+        "scale": {"planets": args.planets, "characters": args.characters, "vehicles": args.vehicles,
+                  "users": args.users, "favorites": len(favorite_owners)},
+        "requests_per_scenario": args.requests,
+        "scenarios": {},
+    }
+    try:
+        for name, method, path, body in scenarios(args, rng, favorite_owners):
+            if selected and name not in selected:
+                continue
+            report["scenarios"][name] = result = run_scenario(driver, method, path, body, args.requests)
+            print("%-24s %9.1f req/s  p50 %8.2f ms  p99 %8.2f ms  sql/req %s" % (
+                name, result["throughput_rps"], result["latency_ms"]["p50"], result["latency_ms"]["p99"],
+                "-" if result["sql_per_request"] is None else "%.1f" % result["sql_per_request"]), file=sys.stderr)
+    finally:
+        if args.gunicorn:
+            driver.close()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            print(diff(report, json.load(handle)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
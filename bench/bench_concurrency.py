@@ -0,0 +1,179 @@
+"""
+Concurrency benchmark: the sync deployment (gunicorn sync workers + src/wsgi.py)
+against the async one (uvicorn + src/asgi.py), with 100 to 1000 concurrent
+keep-alive clients, reporting throughput, latency percentiles and errors
+per concurrency level as JSON.
+
+    python bench/bench_concurrency.py --workers 4 --concurrency 100,250,500,1000
+    python bench/bench_concurrency.py --database-url postgresql://... --only async
+
+Without --database-url a throwaway SQLite database is seeded with
+bench_api.py's data set; an existing --database-url is used as is.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_api import ROOT, SRC, percentile, seed
+
+SERVERS = {
+    "sync": lambda args: [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC,
+                          "-b", "127.0.0.1:%d" % args.port, "-w", str(args.workers), "--log-level", "warning"],
+    "async": lambda args: [sys.executable, "-m", "uvicorn", "asgi:application", "--app-dir", SRC,
+                           "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning",
+                           "--backlog", "4096"],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--characters", type=int, default=1000)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--favorites", default="10:100", help="min:max favorites per user")
+    parser.add_argument("--concurrency", default="100,250,500,1000", help="comma separated client counts")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per concurrency level")
+    parser.add_argument("--only", help="sync or async")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--database-url", help="use this database instead of a seeded SQLite file")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def paths(args, rng):
+    # DB backed reads only, the plain catalog lists are served from memory in both modes
+    choices = [
+        lambda: "/planet/%d" % rng.randint(1, args.planets),
+        lambda: "/character/%d" % rng.randint(1, args.characters),
+        lambda: "/user/%d/favorites" % rng.randint(1, args.users),
+        lambda: "/planets?climate=arid&limit=20",
+        lambda: "/characters?sort=-height&limit=20",
+    ]
+    return lambda: rng.choice(choices)()
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def client(port, next_path, remaining, latencies, statuses):
+    reader = writer = None
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(("GET %s HTTP/1.1\r\nHost: bench\r\n\r\n" % next_path()).encode())
+            status, keep_alive = await asyncio.wait_for(read_response(reader), 60)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            status, keep_alive = "error", False
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if not keep_alive and writer is not None:
+            # gunicorn sync workers close the connection after every response
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(port, next_path, concurrency, count):
+    latencies = []
+    statuses = {}
+    remaining = [count]
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, next_path, remaining, latencies, statuses) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": count,
+        "throughput_rps": round(count / elapsed, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+        },
+        "status": statuses,
+    }
+
+
+def wait_ready(process, port):
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                raise RuntimeError("server did not start")
+            time.sleep(0.2)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+        os.environ["DATABASE_URL"] = database_url
+        sys.path.insert(0, SRC)
+        from app import app
+        seed(app, args, rng)
+
+    levels = [int(value) for value in args.concurrency.split(",")]
+    report = {"workers": args.workers, "requests_per_level": args.requests, "modes": {}}
+    for mode, command in SERVERS.items():
+        if args.only and mode != args.only:
+            continue
+        env = dict(os.environ, DATABASE_URL=database_url)
+        process = subprocess.Popen(command(args), env=env, cwd=ROOT)
+        try:
+            wait_ready(process, args.port)
+            report["modes"][mode] = results = []
+            for concurrency in levels:
+                result = asyncio.run(run_level(args.port, paths(args, rng), concurrency, args.requests))
+                results.append(result)
+                print("%-6s c=%-5d %9.1f req/s  p50 %8.2f ms  p99 %8.2f ms  %s" % (
+                    mode, concurrency, result["throughput_rps"], result["latency_ms"]["p50"],
+                    result["latency_ms"]["p99"], result["status"]), file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
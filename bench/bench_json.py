@@ -0,0 +1,99 @@
+"""
+Serialization benchmark: builds the response body of a 10k-row list three
+ways and reports the best time of each stage as JSON.
+
+- orm: hydrate model instances, call serialize(), stdlib json provider
+  (what the list routes used to do)
+- rows: select the serialized columns, dict(zip()) per row, stdlib provider
+- rows+orjson: same rows through the orjson provider (the default)
+
+    python bench/bench_json.py --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def best(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    sys.path.insert(0, SRC)
+
+    from flask.json.provider import DefaultJSONProvider
+    from sqlalchemy import insert
+    from app import app
+    from jsonprovider import OrjsonProvider, orjson
+    from models import db, Planet
+    from utils import select_fields
+
+    stdlib = DefaultJSONProvider(app)
+    fast = OrjsonProvider(app) if orjson is not None else None
+    report = {"rows": args.rows, "orjson": fast is not None, "ms": {}}
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(Planet), [
+            {"name": "Planet %d" % i, "climate": rng.choice(["arid", "temperate", "frozen"]),
+             "terrain": "desert", "gravity": "1 standard", "population": str(rng.randint(0, 10 ** 9)),
+             "diameter": str(rng.randint(1000, 20000)), "rotation_period": str(rng.randint(10, 40))}
+            for i in range(args.rows)
+        ])
+        db.session.commit()
+
+        with app.test_request_context("/planets?all=1"):
+            query, serialize = select_fields(Planet)
+
+            def orm():
+                items = [item.serialize() for item in Planet.query.order_by(Planet.id).all()]
+                db.session.expunge_all()
+                return items
+
+            def rows():
+                return [serialize(row) for row in query.order_by(Planet.id).all()]
+
+            body = {"msg": "Hello, this is your GET /planets response ", "results": rows(), "next": None}
+            stages = {
+                "fetch+serialize orm": orm,
+                "fetch+serialize rows": rows,
+                "encode stdlib": lambda: stdlib.response(body),
+                "total orm+stdlib": lambda: stdlib.response(dict(body, results=orm())),
+                "total rows+stdlib": lambda: stdlib.response(dict(body, results=rows())),
+            }
+            if fast is not None:
+                stages["encode orjson"] = lambda: fast.response(body)
+                stages["total rows+orjson"] = lambda: fast.response(dict(body, results=rows()))
+
+            for name, fn in stages.items():
+                report["ms"][name] = round(best(fn, args.repeat), 2)
+                print("%-24s %9.2f ms" % (name, report["ms"][name]), file=sys.stderr)
+
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Cold start benchmark: imports and builds the app in fresh interpreters under
+`python -X importtime` for each APP_PROFILE, reporting the total import
+time, the time until create_app() returns and until the first response, and
+the packages that cost the most to import, as JSON.
+
+    python bench/bench_startup.py --repeat 7
+    python bench/bench_startup.py --profiles production --top 20
+
+A throwaway SQLite database is seeded with bench_api.py's data set, so the
+development profile pays for its catalog snapshots like it would in a deploy.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from bench_api import ROOT, SRC, seed
+
+# runs in the measured interpreter, prints its timings as JSON on stdout
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, %(src)r)
+from app import create_app
+imported = time.perf_counter()
+app = create_app(%(profile)r)
+created = time.perf_counter()
+status = app.test_client().get("/planet/1").status_code
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (answered - created) * 1000,
+    "total_ms": (answered - started) * 1000,
+    "status": status,
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="development,production", help="comma separated APP_PROFILEs")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per profile, medians are reported")
+    parser.add_argument("--top", type=int, default=10, help="most expensive top-level packages to list")
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--characters", type=int, default=1000)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--favorites", default="10:100", help="min:max favorites per user")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def parse_importtime(stderr):
+    """Self time in microseconds per top-level package from -X importtime output."""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    return packages
+
+
+def measure(profile, env):
+    env = dict(env, APP_PROFILE=profile)
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE % {"src": SRC, "profile": profile}],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(process.stderr)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, SRC)
+    from app import app
+    seed(app, args, rng)
+
+    report = {"repeat": args.repeat, "profiles": {}}
+    for profile in args.profiles.split(","):
+        runs = [measure(profile, os.environ) for _ in range(args.repeat)]
+        packages = {}
+        for _, imported in runs:
+            for package, self_us in imported.items():
+                packages.setdefault(package, []).append(self_us)
+        import_us = [sum(imported.values()) for _, imported in runs]
+        top = sorted(((statistics.median(values), package) for package, values in packages.items()), reverse=True)
+        report["profiles"][profile] = result = {
+            "modules_ms": round(statistics.median(import_us) / 1000, 2),
+            "packages": len(runs[-1][1]),
+            "top_packages_ms": {package: round(us / 1000, 2) for us, package in top[:args.top]},
+        }
+        for key in ("import_ms", "create_app_ms", "first_request_ms", "total_ms"):
+            result[key] = round(statistics.median(timings[key] for timings, _ in runs), 2)
+        print("%-12s imports %8.1f ms  create_app %7.1f ms  first request %7.1f ms  total %8.1f ms" % (
+            profile, result["import_ms"], result["create_app_ms"], result["first_request_ms"], result["total_ms"]
+        ), file=sys.stderr)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
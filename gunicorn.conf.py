@@ -0,0 +1,56 @@
+# Gunicorn settings, picked up automatically by `gunicorn wsgi --chdir ./src/`
+import os
+import shutil
+import tempfile
+
+# every worker writes its Prometheus samples here so /metrics can aggregate them
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-multiproc"))
+# the preloaded app creates its metrics before on_starting runs
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+# import and build the app once in the master, the workers fork ready to serve
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+
+def _flask_app(server):
+    # None for `asgi:application` (uvicorn workers), its snapshots build on first use
+    from flask import Flask
+    application = server.app.wsgi()
+    return application if isinstance(application, Flask) else None
+
+
+def on_starting(server):
+    # stale files from a previous run would be added to the new counters
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def when_ready(server):
+    app = _flask_app(server) if server.cfg.preload_app else None
+    if app is None:
+        return
+    from snapshot import build_snapshots
+    from models import db
+    # built once here, every worker inherits the catalog in memory
+    build_snapshots(app)
+    with app.app_context():
+        # the workers must not share the master's connections
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    app = _flask_app(server) if server.cfg.preload_app else None
+    if app is None:
+        return
+    from database import warm_pool
+    from metrics import record_pool_size
+    from models import db
+    with app.app_context():
+        warm_pool(db.engine)
+        record_pool_size(db.engine)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -38,6 +38,22 @@ def get_metadata():
     return target_db.metadata
 
 
+# full-text search objects live outside the models (see src/search.py and
+# f9731c0cb4a0): the SQLite FTS5 tables with their shadow tables, and the
+# Postgres search_vector column and its index
+FTS_SUFFIXES = ('_fts', '_fts_data', '_fts_idx', '_fts_docsize', '_fts_config')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and name.endswith(FTS_SUFFIXES):
+        return False
+    if type_ == 'column' and name == 'search_vector':
+        return False
+    if type_ == 'index' and name.endswith('_search_vector'):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -52,7 +68,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -84,6 +101,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=get_metadata(),
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,46 @@
+"""indexes for the catalog filters and sorting
+
+Revision ID: 3979872d91f6
+Revises: d398f693a165
+Create Date: 2026-10-18 11:47:05.126774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3979872d91f6'
+down_revision = 'd398f693a165'
+branch_labels = None
+depends_on = None
+
+INDEXED = {
+    'planet': ('name', 'climate', 'terrain'),
+    'character': ('gender', 'eye_color', 'planet_id'),
+    'vehicle': ('model', 'manufacturer', 'vehicle_class'),
+}
+
+
+def upgrade():
+    for table, columns in INDEXED.items():
+        for column in columns:
+            op.create_index(op.f('ix_%s_%s' % (table, column)), table, [column], unique=False)
+
+    # ?name_prefix= is a LIKE 'x%' match, Postgres only serves it from a pattern_ops index
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in INDEXED:
+            op.create_index(
+                'ix_%s_name_pattern' % table, table, ['name'], unique=False,
+                postgresql_ops={'name': 'varchar_pattern_ops'}
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in INDEXED:
+            op.drop_index('ix_%s_name_pattern' % table, table_name=table)
+
+    for table, columns in INDEXED.items():
+        for column in columns:
+            op.drop_index(op.f('ix_%s_%s' % (table, column)), table_name=table)
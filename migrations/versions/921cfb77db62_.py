@@ -0,0 +1,77 @@
+"""numeric shadow columns for planet, character and vehicle stats
+
+Revision ID: 921cfb77db62
+Revises: f9731c0cb4a0
+Create Date: 2026-10-18 13:05:51.662018
+
+"""
+import math
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '921cfb77db62'
+down_revision = 'f9731c0cb4a0'
+branch_labels = None
+depends_on = None
+
+# keep in sync with numeric_fields in src/models.py
+NUMERIC = {
+    'planet': ('rotation_period', 'orbital_period', 'diameter', 'surface_water', 'population'),
+    'character': ('height', 'mass'),
+    'vehicle': ('cost_in_credits', 'length', 'max_atmosphering_speed', 'crew', 'passengers', 'cargo_capacity'),
+}
+BATCH_SIZE = 1000
+
+
+def parse_number(value):
+    # same rules as models.parse_number: "unknown", "n/a", "nan"... become NULL
+    if value is None:
+        return None
+    try:
+        number = float(re.sub(r"[,\s]", "", str(value)))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def backfill(bind, table, fields):
+    # keyset chunks: only BATCH_SIZE rows in memory, whatever the table size
+    select = sa.text("SELECT id, %s FROM %s WHERE id > :last_id ORDER BY id LIMIT :limit" % (", ".join(fields), table))
+    update = sa.text("UPDATE %s SET %s WHERE id = :id" % (
+        table, ", ".join("%s_num = :%s_num" % (field, field) for field in fields)
+    ))
+    last_id = 0
+    while True:
+        rows = bind.execute(select, {"last_id": last_id, "limit": BATCH_SIZE}).mappings().all()
+        if not rows:
+            break
+        batch = []
+        for row in rows:
+            values = {"id": row["id"]}
+            values.update({"%s_num" % field: parse_number(row[field]) for field in fields})
+            batch.append(values)
+        bind.execute(update, batch)
+        last_id = rows[-1]["id"]
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, fields in NUMERIC.items():
+        for field in fields:
+            op.add_column(table, sa.Column('%s_num' % field, sa.Float(), nullable=True))
+        backfill(bind, table, fields)
+        for field in fields:
+            op.create_index(op.f('ix_%s_%s_num' % (table, field)), table, ['%s_num' % field], unique=False)
+
+
+def downgrade():
+    for table, fields in NUMERIC.items():
+        for field in fields:
+            op.drop_index(op.f('ix_%s_%s_num' % (table, field)), table_name=table)
+        # ALTER TABLE ... DROP COLUMN in place: a batch rebuild would DROP TABLE
+        # under PRAGMA foreign_keys=ON and lose the FTS triggers of f9731c0cb4a0
+        for field in fields:
+            op.drop_column(table, '%s_num' % field)
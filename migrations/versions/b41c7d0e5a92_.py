@@ -0,0 +1,41 @@
+"""favorites_count counters on planet, character and vehicle
+
+Revision ID: b41c7d0e5a92
+Revises: 921cfb77db62
+Create Date: 2026-10-18 15:42:10.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41c7d0e5a92'
+down_revision = '921cfb77db62'
+branch_labels = None
+depends_on = None
+
+# keep in sync with FAVORITE_TARGETS in src/models.py
+TARGETS = ('planet', 'character', 'vehicle')
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table in TARGETS:
+        op.add_column(table, sa.Column('favorites_count', sa.Integer(), server_default='0', nullable=False))
+        # one statement per table, the counts come from the ix_favorites_<table>_id indexes
+        bind.execute(sa.text(
+            "UPDATE %s SET favorites_count = "
+            "(SELECT COUNT(*) FROM favorites WHERE favorites.%s_id = %s.id)" % (table, table, table)
+        ))
+        op.create_index('ix_%s_favorites_count_id' % table, table, ['favorites_count', 'id'], unique=False)
+    # served ETags and in-memory catalogs are stale now
+    bind.execute(sa.text(
+        "UPDATE table_version SET version = version + 1 WHERE name IN ('planet', 'character', 'vehicle')"
+    ))
+
+
+def downgrade():
+    for table in TARGETS:
+        op.drop_index('ix_%s_favorites_count_id' % table, table_name=table)
+        op.drop_column(table, 'favorites_count')
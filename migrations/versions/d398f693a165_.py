@@ -0,0 +1,43 @@
+"""favorites indexes and one favorite per user and target
+
+Revision ID: d398f693a165
+Revises: f27f6b3c364b
+Create Date: 2026-10-18 11:02:17.540391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd398f693a165'
+down_revision = 'f27f6b3c364b'
+branch_labels = None
+depends_on = None
+
+TARGETS = ('planet_id', 'character_id', 'vehicle_id')
+
+
+def upgrade():
+    # keep the oldest favorite of every (user, target) pair before adding the unique indexes
+    for column in TARGETS:
+        op.execute(
+            "DELETE FROM favorites WHERE {0} IS NOT NULL AND id NOT IN ("
+            "SELECT MIN(id) FROM favorites WHERE {0} IS NOT NULL GROUP BY user_id, {0})".format(column)
+        )
+
+    op.create_index('ix_favorites_user_id_id', 'favorites', ['user_id', 'id'], unique=False)
+    for column in TARGETS:
+        op.create_index('ix_favorites_%s' % column, 'favorites', [column], unique=False)
+        op.create_index(
+            'uq_favorites_user_id_%s' % column, 'favorites', ['user_id', column], unique=True,
+            postgresql_where=sa.text('%s IS NOT NULL' % column),
+            sqlite_where=sa.text('%s IS NOT NULL' % column)
+        )
+
+
+def downgrade():
+    for column in TARGETS:
+        op.drop_index('uq_favorites_user_id_%s' % column, table_name='favorites')
+        op.drop_index('ix_favorites_%s' % column, table_name='favorites')
+    op.drop_index('ix_favorites_user_id_id', table_name='favorites')
@@ -0,0 +1,32 @@
+"""table_version generation counters
+
+Revision ID: f27f6b3c364b
+Revises: 7f059811f783
+Create Date: 2026-10-18 10:12:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f27f6b3c364b'
+down_revision = '7f059811f783'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(table_version, [
+        {'name': name, 'version': 0}
+        for name in ('user', 'planet', 'character', 'vehicle', 'favorites')
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
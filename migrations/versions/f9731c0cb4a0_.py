@@ -0,0 +1,73 @@
+"""full-text search indexes for planets, characters and vehicles
+
+Revision ID: f9731c0cb4a0
+Revises: 3979872d91f6
+Create Date: 2026-10-18 12:20:44.903152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9731c0cb4a0'
+down_revision = '3979872d91f6'
+branch_labels = None
+depends_on = None
+
+# keep in sync with SEARCHABLE in src/search.py
+SEARCHABLE = {
+    'planet': ('name', 'climate', 'terrain'),
+    'character': ('name', 'gender', 'hair_color', 'skin_color', 'eye_color'),
+    'vehicle': ('name', 'model', 'manufacturer', 'vehicle_class'),
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, columns in SEARCHABLE.items():
+        if dialect == 'postgresql':
+            document = " || ' ' || ".join("coalesce(%s, '')" % column for column in columns)
+            op.execute(
+                "ALTER TABLE %s ADD COLUMN search_vector tsvector "
+                "GENERATED ALWAYS AS (to_tsvector('simple', %s)) STORED" % (table, document)
+            )
+            op.execute("CREATE INDEX ix_%s_search_vector ON %s USING gin (search_vector)" % (table, table))
+        elif dialect == 'sqlite':
+            listed = ", ".join(columns)
+            new_values = ", ".join("new.%s" % column for column in columns)
+            old_values = ", ".join("old.%s" % column for column in columns)
+            op.execute(
+                "CREATE VIRTUAL TABLE %s_fts USING fts5(%s, content='%s', content_rowid='id')"
+                % (table, listed, table)
+            )
+            # external content table: triggers keep the index in step with the rows
+            op.execute(
+                "CREATE TRIGGER %(t)s_fts_insert AFTER INSERT ON %(t)s BEGIN "
+                "INSERT INTO %(t)s_fts(rowid, %(c)s) VALUES (new.id, %(new)s); END"
+                % {'t': table, 'c': listed, 'new': new_values}
+            )
+            op.execute(
+                "CREATE TRIGGER %(t)s_fts_delete AFTER DELETE ON %(t)s BEGIN "
+                "INSERT INTO %(t)s_fts(%(t)s_fts, rowid, %(c)s) VALUES ('delete', old.id, %(old)s); END"
+                % {'t': table, 'c': listed, 'old': old_values}
+            )
+            op.execute(
+                "CREATE TRIGGER %(t)s_fts_update AFTER UPDATE ON %(t)s BEGIN "
+                "INSERT INTO %(t)s_fts(%(t)s_fts, rowid, %(c)s) VALUES ('delete', old.id, %(old)s); "
+                "INSERT INTO %(t)s_fts(rowid, %(c)s) VALUES (new.id, %(new)s); END"
+                % {'t': table, 'c': listed, 'old': old_values, 'new': new_values}
+            )
+            op.execute("INSERT INTO %s_fts(%s_fts) VALUES ('rebuild')" % (table, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in SEARCHABLE:
+        if dialect == 'postgresql':
+            op.execute("DROP INDEX ix_%s_search_vector" % table)
+            op.execute("ALTER TABLE %s DROP COLUMN search_vector" % table)
+        elif dialect == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute("DROP TRIGGER %s_fts_%s" % (table, trigger))
+            op.execute("DROP TABLE %s_fts" % table)
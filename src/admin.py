@@ -1,9 +1,20 @@
 import os
-from flask_admin import Admin
+import threading
+from flask import Flask
 from models import db, User, Planet, Character, Favorites, Vehicle
-from flask_admin.contrib.sqla import ModelView
 
-def setup_admin(app):
+# ADMIN_MODE: mounted with the app, on the first /admin request, or never
+ADMIN_MODES = ("eager", "lazy", "off")
+
+def mount_admin(app):
+    # flask-admin (and wtforms) are only imported once the admin is needed
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+
+    class CatalogView(ModelView):
+        # maintained by counters.py from the Favorites rows
+        form_excluded_columns = ('favorites_count',)
+
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
@@ -11,10 +22,49 @@ def setup_admin(app):
     
     # Add your models here, for example this is how we add a the User model to the admin
     admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Vehicle, db.session))
+    admin.add_view(CatalogView(Planet, db.session))
+    admin.add_view(CatalogView(Character, db.session))
+    admin.add_view(CatalogView(Vehicle, db.session))
     admin.add_view(ModelView(Favorites, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
+
+class LazyAdmin:
+    """WSGI middleware building the admin on the first /admin request.
+
+    Flask refuses new routes once an app has served a request, so the admin
+    is a Flask app of its own, with the same config and db.session (and so
+    the same cache / ETag / snapshot hooks on its writes).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.admin_app = None
+        self.lock = threading.Lock()
+
+    def _build(self):
+        admin_app = Flask(self.app.import_name)
+        admin_app.config.update(self.app.config)
+        db.init_app(admin_app)
+        mount_admin(admin_app)
+        return admin_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path != "/admin" and not path.startswith("/admin/"):
+            return self.wsgi_app(environ, start_response)
+        with self.lock:
+            if self.admin_app is None:
+                self.admin_app = self._build()
+        return self.admin_app.wsgi_app(environ, start_response)
+
+def setup_admin(app):
+    mode = app.config.get("ADMIN_MODE", "eager")
+    if mode not in ADMIN_MODES:
+        raise ValueError("ADMIN_MODE must be one of %s, not %r" % (", ".join(ADMIN_MODES), mode))
+    if mode == "eager":
+        mount_admin(app)
+    elif mode == "lazy":
+        app.wsgi_app = LazyAdmin(app)
@@ -2,214 +2,331 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+import tempfile
+from flask import Flask, Blueprint, request, jsonify, current_app
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from utils import APIException, generate_sitemap, paginate, wants_stream, stream_list, select_fields, project, requested_fields, page_size, encode_cursor, decode_cursor
 from admin import setup_admin
-from models import db, User, Planet, Character, Vehicle, Favorites
+from cache import setup_cache, entity_cache, get_serialized
+from etags import setup_etags, conditional
+from bulk import create_many
+from metrics import setup_metrics, setup_pool_metrics, render_metrics
+from database import database_url, engine_options
+from querystats import setup_query_stats
+from filters import apply_filters, requested_sort
+from search import search, SEARCHABLE
+from compress import setup_compression
+from jsonprovider import setup_json
+from snapshot import setup_snapshots, build_snapshots, from_snapshot
+from importer import setup_import
+from exporter import setup_export, check_token, export_response
+from ratelimit import setup_rate_limit, parse_limit, parse_limits, parse_proxies
+from counters import setup_counters, top_favorites
+from models import db, User, Planet, Character, Vehicle, Favorites, FAVORITE_TARGETS, entity_columns
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 #from models import Person
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
+api = Blueprint('api', __name__)
+
+PROFILES = ("development", "production")
+
+
+def create_app(profile=None):
+    """Build the API app for a profile (APP_PROFILE, "development" by default).
+
+    "production" keeps the cold start short: flask-admin is imported and
+    mounted on the first /admin request (ADMIN_MODE=lazy, or off), alembic
+    only when the `flask` command runs, and the catalog snapshots are left
+    to gunicorn's preload hooks (gunicorn.conf.py) or the first request.
+    """
+    profile = profile or os.getenv("APP_PROFILE", "development")
+    if profile not in PROFILES:
+        raise ValueError("APP_PROFILE must be one of %s, not %r" % (", ".join(PROFILES), profile))
+
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+
+    app.config['APP_PROFILE'] = profile
+    app.config['ADMIN_MODE'] = os.getenv("ADMIN_MODE", "eager" if profile == "development" else "lazy")
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['DEFAULT_PAGE_SIZE'] = int(os.getenv("DEFAULT_PAGE_SIZE", 100))
+    app.config['MAX_PAGE_SIZE'] = int(os.getenv("MAX_PAGE_SIZE", 1000))
+    app.config['STREAM_CHUNK_SIZE'] = int(os.getenv("STREAM_CHUNK_SIZE", 500))
+    app.config['ENTITY_CACHE_SIZE'] = int(os.getenv("ENTITY_CACHE_SIZE", 1024))
+    app.config['ENTITY_CACHE_TTL'] = float(os.getenv("ENTITY_CACHE_TTL", 300))
+    app.config['CACHE_CONTROL'] = os.getenv("CACHE_CONTROL", "no-cache")
+    app.config['BULK_CHUNK_SIZE'] = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+    app.config['SQL_STATS_HEADERS'] = os.getenv("SQL_STATS_HEADERS", "").lower() in ("1", "true", "yes")
+    app.config['SLOW_QUERY_MS'] = float(os.getenv("SLOW_QUERY_MS", 0))
+    app.config['SLOW_QUERY_EXPLAIN'] = os.getenv("SLOW_QUERY_EXPLAIN", "").lower() in ("1", "true", "yes")
+    app.config['SQL_QUERY_BUDGET'] = int(os.getenv("SQL_QUERY_BUDGET", 0))
+    app.config['SNAPSHOT_ENABLED'] = os.getenv("SNAPSHOT_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config['SNAPSHOT_CHECK_INTERVAL'] = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", 1))
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config['RATE_LIMIT_DEFAULT'] = parse_limit(os.getenv("RATE_LIMIT_DEFAULT", "20,40"))
+    app.config['RATE_LIMITS'] = parse_limits(os.getenv("RATE_LIMITS", "/planets=5,20;/characters=5,20"))
+    app.config['RATE_LIMIT_FILE'] = os.getenv("RATE_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "starwars-api-ratelimit"))
+    app.config['RATE_LIMIT_SLOTS'] = int(os.getenv("RATE_LIMIT_SLOTS", 65536))
+    app.config['RATE_LIMIT_TRUST_PROXY'] = parse_proxies(os.getenv("RATE_LIMIT_TRUST_PROXY", ""))
+    app.config['EXPORT_TOKEN'] = os.getenv("EXPORT_TOKEN")
+    app.config['JSON_PROVIDER'] = os.getenv("JSON_PROVIDER", "orjson")
+    app.config['COMPRESS_ENABLED'] = os.getenv("COMPRESS_ENABLED", "true").lower() in ("1", "true", "yes")
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    app.config['COMPRESS_LEVEL_GZIP'] = int(os.getenv("COMPRESS_LEVEL_GZIP", 6))
+    app.config['COMPRESS_LEVEL_BR'] = int(os.getenv("COMPRESS_LEVEL_BR", 5))
+    app.config['COMPRESS_LEVEL_ZSTD'] = int(os.getenv("COMPRESS_LEVEL_ZSTD", 3))
+    app.config['COMPRESS_CACHE_SIZE'] = int(os.getenv("COMPRESS_CACHE_SIZE", 256))
+    app.config['COMPRESS_CACHE_TTL'] = float(os.getenv("COMPRESS_CACHE_TTL", 300))
+
+    setup_json(app)
+    if profile == "development" or os.getenv("FLASK_RUN_FROM_CLI"):
+        # `flask db ...`, alembic is a large import the web workers never use
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    db.init_app(app)
+    CORS(app)
+    # registered first so it runs after every other after_request hook
+    setup_compression(app)
+    setup_admin(app)
+    setup_cache(app, db.session)
+    setup_etags(app, db.session)
+    setup_snapshots(app, db.session)
+    setup_counters(app, db.session)
+    setup_metrics(app)
+    # after the metrics hooks, so rejected requests are still counted
+    setup_rate_limit(app)
+    setup_import(app)
+    setup_export(app)
+    with app.app_context():
+        setup_query_stats(app, db.engine)
+        setup_pool_metrics(db.engine)
+    app.register_blueprint(api)
+
+    if profile == "development":
+        # serve the catalog lists from memory from the first request on
+        build_snapshots(app)
+    return app
 
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return generate_sitemap(current_app)
 
 
 # ********** GET ***********
 
 # Get all users
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@conditional('user')
 def get_all_users():
 
-    all_users = User.query.all()
+    query, serialize = select_fields(User)
+    all_users, next_cursor = paginate(query, User)
 
     if not all_users:
         return ({"msg": "Users not found"}), 404
 
-    users_serialized = list(map(lambda item : item.serialize(), all_users))
+    users_serialized = list(map(serialize, all_users))
 
     response_body = {
         "msg": "Hello, this is your GET /user response ",
-        "results": users_serialized
+        "results": users_serialized,
+        "next": next_cursor
     }
 
     return jsonify(response_body), 200
 
 # Get user by id
-@app.route('/user/<int:id>', methods=['GET'])
+@api.route('/user/<int:id>', methods=['GET'])
+@conditional('user')
 def get_one_user(id):
 
-    user = User.query.filter_by(id=id).first()
+    fields = requested_fields(entity_columns(User))
+    user_serialized = get_serialized(User, id)
 
-    if user is None:
+    if user_serialized is None:
         return jsonify({"msg": "User not found"}), 404
     
     response_body = {
         "msg": "Hello, this is your GET /user/id response ",
-        "result": user.serialize()
+        "result": project(user_serialized, fields)
     }
 
     return jsonify(response_body), 200
 
 # Get all planets
-@app.route('/planets', methods=['GET'])
+@api.route('/planets', methods=['GET'])
+@from_snapshot(Planet, "Hello, this is your GET /planets response ")
+@conditional('planet')
 def get_all_planets():
 
-    all_planets = Planet.query.all()
+    sort = requested_sort(Planet)
+    query, serialize = select_fields(Planet, sort)
+    query = apply_filters(query, Planet)
+
+    if wants_stream():
+        return stream_list(query, Planet, "Hello, this is your GET /planets response ", serialize, sort)
+
+    all_planets, next_cursor = paginate(query, Planet, sort)
 
     if not all_planets:
         return ({"msg": "Planets not found"}), 404
     
-    planets_serialized = list(map(lambda item : item.serialize(), all_planets))
+    planets_serialized = list(map(serialize, all_planets))
     # print(planets_serialized)
 
 
     response_body = {
         "msg": "Hello, this is your GET /planets response ",
-        "results": planets_serialized
+        "results": planets_serialized,
+        "next": next_cursor
     }
 
     return jsonify(response_body), 200
 
 # Get all characters
-@app.route('/characters', methods=['GET'])
+@api.route('/characters', methods=['GET'])
+@from_snapshot(Character, "Hello, this is your GET /characters response ")
+@conditional('character')
 def get_all_characters():
 
-    all_characters = Character.query.all()
+    sort = requested_sort(Character)
+    query, serialize = select_fields(Character, sort)
+    query = apply_filters(query, Character)
+
+    if wants_stream():
+        return stream_list(query, Character, "Hello, this is your GET /characters response ", serialize, sort)
+
+    all_characters, next_cursor = paginate(query, Character, sort)
 
     if not all_characters:
         return ({"msg": "Characters not found"}), 404
 
-    characters_serialized = list(map(lambda item : item.serialize(), all_characters))
+    characters_serialized = list(map(serialize, all_characters))
     # print(characters_serialized)
 
     response_body = {
         "msg": "Hello, this is your GET /characters response ",
-        "results": characters_serialized
+        "results": characters_serialized,
+        "next": next_cursor
     }
 
     return jsonify(response_body), 200
 
 # Get all vehicles
-@app.route('/vehicles', methods=['GET'])
+@api.route('/vehicles', methods=['GET'])
+@from_snapshot(Vehicle, "Hello, this is your GET /vehicles response ")
+@conditional('vehicle')
 def get_all_vehicles():
 
-    all_vehicles = Vehicle.query.all()
+    sort = requested_sort(Vehicle)
+    query, serialize = select_fields(Vehicle, sort)
+    query = apply_filters(query, Vehicle)
+
+    if wants_stream():
+        return stream_list(query, Vehicle, "Hello, this is your GET /vehicles response ", serialize, sort)
+
+    all_vehicles, next_cursor = paginate(query, Vehicle, sort)
 
     if not all_vehicles:
         return ({"msg": "Vehicles not found"}), 404
     
-    vehicles_serialized = list(map(lambda item : item.serialize(), all_vehicles))
+    vehicles_serialized = list(map(serialize, all_vehicles))
     
 
     response_body = {
         "msg": "Hello, this is your GET /vehicles response ",
-        "results": vehicles_serialized
+        "results": vehicles_serialized,
+        "next": next_cursor
     }
 
     return jsonify(response_body), 200
 
 
 # Get character by id
-@app.route('/character/<int:id>', methods=['GET'])
+@api.route('/character/<int:id>', methods=['GET'])
+@conditional('character', 'character.favorites_count')
 def get_one_character(id):
 
-    character = Character.query.filter_by(id=id).first()
+    fields = requested_fields(entity_columns(Character))
+    character_serialized = get_serialized(Character, id)
 
-    if character is None:
+    if character_serialized is None:
         return jsonify({"msg": "Not found"}), 404
-    
-    character_serialized = character.serialize()
-    # print(character)
 
     response_body = {
         "msg": "Hello, this is your GET /character/id response ",
-        "result": character_serialized
+        "result": project(character_serialized, fields)
     }
 
     return jsonify(response_body), 200
 
 # Get planet by id
-@app.route('/planet/<int:id>', methods=['GET'])
+@api.route('/planet/<int:id>', methods=['GET'])
+@conditional('planet', 'planet.favorites_count')
 def get_one_planet(id):
 
-    planet = Planet.query.filter_by(id=id).first()
+    fields = requested_fields(entity_columns(Planet))
+    planet_serialized = get_serialized(Planet, id)
 
-    if planet is None:
+    if planet_serialized is None:
         return jsonify({"msg": "Planet not found"}), 404
-    
-    planet_serialized = planet.serialize()
-    # print(planet)
 
     response_body = {
         "msg": "Hello, this is your GET /planet/id response ",
-        "result": planet_serialized
+        "result": project(planet_serialized, fields)
     }
 
     return jsonify(response_body), 200
 
 # Get vehicle by id
-@app.route('/vehicle/<int:id>', methods=['GET'])
+@api.route('/vehicle/<int:id>', methods=['GET'])
+@conditional('vehicle', 'vehicle.favorites_count')
 def get_one_vehicle(id):
 
-    vehicle = Vehicle.query.filter_by(id=id).first()
-    if vehicle is None:
+    fields = requested_fields(entity_columns(Vehicle))
+    vehicle_serialized = get_serialized(Vehicle, id)
+
+    if vehicle_serialized is None:
         return jsonify({"msg": "Vehicle not found"}), 404
-    
-    vehicle_serialized = vehicle.serialize()
-    
 
     response_body = {
         "msg": "Hello, this is your GET /vehicle/id response ",
-        "result": vehicle_serialized
+        "result": project(vehicle_serialized, fields)
     }
 
     return jsonify(response_body), 200
 
 # Get specific user's all favorites
-@app.route('/user/<int:id>/favorites', methods=['GET'])
+@api.route('/user/<int:id>/favorites', methods=['GET'])
+@conditional('user', 'favorites', 'character', 'planet', 'vehicle')
 def get_user_favorites(id):
 
+    fields = requested_fields(Favorites.serialize_fields)
+
     # obtención del usuario
     user = User.query.filter_by(id=id).first()
 
     if user is None:
         return jsonify({"msg": "User not found"}), 404
-    
-    user_serialized = user.serialize()
-    print(user)
-    
-    # obtención de sus favoritos
-    favorites = Favorites.query.filter_by(user_id=id).all()
+
+    # obtención de sus favoritos con los nombres en una sola consulta
+    favorites = Favorites.query_with_names(fields).filter(Favorites.user_id == id).order_by(Favorites.id).all()
     
     if not favorites:
         return jsonify({"msg": "No favorites found"}), 404
 
     # serializa cada favorito de la lista
-    favorites_serialized = [favorite.serialize() for favorite in favorites]
-    print(favorites_serialized)
+    favorites_serialized = [Favorites.serialize_row(favorite) for favorite in favorites]
     
     # mostrar resultados en response_body    
     response_body = {
@@ -220,10 +337,85 @@ def get_user_favorites(id):
     return jsonify(response_body), 200
 
 
+# Get the most liked planets, characters or vehicles
+@api.route('/favorites/top', methods=['GET'])
+@conditional('planet', 'character', 'vehicle', 'planet.favorites_count', 'character.favorites_count', 'vehicle.favorites_count')
+def get_top_favorites():
+
+    kind = request.args.get("type")
+
+    if kind not in FAVORITE_TARGETS:
+        raise APIException("type must be one of %s" % ", ".join(FAVORITE_TARGETS), status_code=400, payload={"allowed": list(FAVORITE_TARGETS)})
+
+    limit = page_size() if "limit" in request.args else 20
+    top, serialize = top_favorites(FAVORITE_TARGETS[kind], limit)
+
+    if not top:
+        return jsonify({"msg": "No favorites found"}), 404
+
+    response_body = {
+        "msg": "Hello, this is your GET /favorites/top response ",
+        "results": list(map(serialize, top))
+    }
+
+    return jsonify(response_body), 200
+
+# Full-text search across planets, characters and vehicles
+@api.route('/search', methods=['GET'])
+@conditional('planet', 'character', 'vehicle')
+def search_catalog():
+
+    q = request.args.get("q", "").strip()
+
+    if not q:
+        return jsonify({"msg": "You should specify a search with ?q="}), 400
+
+    types = [kind for kind in request.args.get("type", ",".join(SEARCHABLE)).split(",") if kind]
+    unknown = [kind for kind in types if kind not in SEARCHABLE]
+    if unknown or not types:
+        raise APIException("Unknown type: %s" % ", ".join(unknown), status_code=400, payload={"allowed": list(SEARCHABLE)})
+
+    # ranked results page by offset, the cursor keeps it opaque
+    limit = page_size()
+    after = request.args.get("after")
+    offset = decode_cursor(after, 1)[0] if after else 0
+    if offset < 0:
+        raise APIException("Invalid cursor", status_code=400)
+
+    results = search(db.session, q, types, limit + 1, offset)
+    next_cursor = encode_cursor([offset + limit]) if len(results) > limit else None
+
+    response_body = {
+        "msg": "Hello, this is your GET /search response ",
+        "results": results[:limit],
+        "next": next_cursor
+    }
+
+    return jsonify(response_body), 200
+
+# Entity cache counters
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(entity_cache.stats()), 200
+
+
+# Stream a whole table as NDJSON or CSV, for the nightly analytics dumps
+@api.route('/export/<table>', methods=['GET'])
+def export_table(table):
+    check_token()
+    return export_response(table, request.args.get("format", "ndjson"))
+
+
+# Prometheus metrics of every worker
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return render_metrics()
+
+
 # *********** POSTS ***********
 
 # Post user
-@app.route('/user', methods=['POST'])
+@api.route('/user', methods=['POST'])
 def add_user():
 
     data = request.get_json()
@@ -247,7 +439,7 @@ def add_user():
     return jsonify({"msg": "user email already exists"}), 409
 
 # Post planet
-@app.route('/planet', methods=['POST'])
+@api.route('/planet', methods=['POST'])
 def add_planet():
 
     data = request.get_json()
@@ -273,7 +465,7 @@ def add_planet():
     return jsonify({"msg": "Planet created successfully"}), 201
 
 # Post character
-@app.route('/character', methods=['POST'])
+@api.route('/character', methods=['POST'])
 def add_character():
 
     data = request.get_json()
@@ -298,7 +490,7 @@ def add_character():
     return jsonify({"msg": "Character created successfully"}), 201
 
 # Post vehicle
-@app.route('/vehicle', methods=['POST'])
+@api.route('/vehicle', methods=['POST'])
 def add_vehicle():
 
     data = request.get_json()
@@ -324,11 +516,64 @@ def add_vehicle():
     db.session.commit()
 
     return jsonify({"msg": "Character created successfully"}), 201
-   
 
 
+# Post many planets in one transaction
+@api.route('/planets', methods=['POST'])
+def add_planets():
+
+    data = request.get_json()
+
+    if not isinstance(data, list) or not data:
+        return jsonify({"msg": "You should specify a list of planets"}), 400
+
+    atomic = request.args.get("atomic", "").lower() in ("1", "true", "yes")
+    response_body, status = create_many(Planet, data, atomic, current_app.config['BULK_CHUNK_SIZE'])
+
+    return jsonify(response_body), status
+
+# Post many characters in one transaction
+@api.route('/characters', methods=['POST'])
+def add_characters():
+
+    data = request.get_json()
+
+    if not isinstance(data, list) or not data:
+        return jsonify({"msg": "You should specify a list of characters"}), 400
+
+    atomic = request.args.get("atomic", "").lower() in ("1", "true", "yes")
+    response_body, status = create_many(Character, data, atomic, current_app.config['BULK_CHUNK_SIZE'])
+
+    return jsonify(response_body), status
+
+# Post many vehicles in one transaction
+@api.route('/vehicles', methods=['POST'])
+def add_vehicles():
+
+    data = request.get_json()
+
+    if not isinstance(data, list) or not data:
+        return jsonify({"msg": "You should specify a list of vehicles"}), 400
+
+    atomic = request.args.get("atomic", "").lower() in ("1", "true", "yes")
+    response_body, status = create_many(Vehicle, data, atomic, current_app.config['BULK_CHUNK_SIZE'])
+
+    return jsonify(response_body), status
+
+
+# Explain why a favorite insert hit a constraint
+def favorite_conflict(user_id, model, id):
+
+    if db.session.get(User, user_id) is None:
+        return jsonify({"msg": "user not found"}), 404
+
+    if db.session.get(model, id) is None:
+        return jsonify({"msg": "%s not found" % model.__name__.lower()}), 404
+
+    return jsonify({"msg": "%s already liked" % model.__name__}), 409
+
 # Post favorite planet for specific user
-@app.route('/favorite/planet/<int:id>', methods=['POST'])
+@api.route('/favorite/planet/<int:id>', methods=['POST'])
 def add_favorite_planet(id):
 
     data = request.get_json()
@@ -336,22 +581,15 @@ def add_favorite_planet(id):
     if not data:
         return jsonify({"msg": "You should specify a user"}), 400
     
-    user_id = data["user_id"]
-    user = User.query.get(user_id)
-    planet = Planet.query.get(id)
-
-    # print(user, planet)
-
-    if not user:
-        return jsonify({"msg": "user not found"}), 404
-    
-    if not planet:
-        return jsonify({"msg": "planet not found"}), 404
-    
-
+    # the foreign keys and the unique index do the checks, no lookups needed
     favorite_planet = Favorites(user_id = data["user_id"], planet_id = id)
     db.session.add(favorite_planet)
-    db.session.commit()
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return favorite_conflict(data["user_id"], Planet, id)
    
     response_body = {
         "msg": "Planet liked"
@@ -360,7 +598,7 @@ def add_favorite_planet(id):
     return jsonify(response_body), 201
 
 # Post favorite character for specific user
-@app.route('/favorite/character/<int:id>', methods=['POST'])
+@api.route('/favorite/character/<int:id>', methods=['POST'])
 def add_favorite_character(id):
 
     data = request.get_json()
@@ -368,20 +606,15 @@ def add_favorite_character(id):
     if not data:
         return jsonify({"msg": "You should specify a user"}), 400
     
-    user_id = data["user_id"]
-    user = User.query.get(user_id)
-    character = Character.query.get(id)
-
-    if not user:
-        return jsonify({"msg": "user not found"}), 404
-    
-    if not character:
-        return jsonify({"msg": "character not found"}), 404
-    
-
+    # the foreign keys and the unique index do the checks, no lookups needed
     favorite_character = Favorites(user_id = data["user_id"], character_id = id)
     db.session.add(favorite_character)
-    db.session.commit()
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return favorite_conflict(data["user_id"], Character, id)
    
     response_body = {
         "msg": "Character liked"
@@ -390,7 +623,7 @@ def add_favorite_character(id):
     return jsonify(response_body), 201
 
 # Post favorite vehicle for specific user
-@app.route('/favorite/vehicle/<int:id>', methods=['POST'])
+@api.route('/favorite/vehicle/<int:id>', methods=['POST'])
 def add_favorite_vehicle(id):
 
     data = request.get_json()
@@ -398,20 +631,15 @@ def add_favorite_vehicle(id):
     if not data:
         return jsonify({"msg": "You should specify a user"}), 400
     
-    user_id = data["user_id"]
-    user = User.query.get(user_id)
-    vehicle = Vehicle.query.get(id)
-
-    if not user:
-        return jsonify({"msg": "user not found"}), 404
-    
-    if not vehicle:
-        return jsonify({"msg": "vehicle not found"}), 404
-    
-
+    # the foreign keys and the unique index do the checks, no lookups needed
     favorite_vehicle = Favorites(user_id = data["user_id"], vehicle_id = id)
     db.session.add(favorite_vehicle)
-    db.session.commit()
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return favorite_conflict(data["user_id"], Vehicle, id)
    
     response_body = {
         "msg": "Vehicle liked"
@@ -419,10 +647,92 @@ def add_favorite_vehicle(id):
 
     return jsonify(response_body), 201
 
+# Add and remove many favorites of a specific user in one transaction
+@api.route('/user/<int:id>/favorites', methods=['POST'])
+def batch_user_favorites(id):
+
+    data = request.get_json()
+
+    if not isinstance(data, dict) or not (data.get("add") or data.get("remove")):
+        return jsonify({"msg": "You should specify favorites to add or remove"}), 400
+
+    # agrupa los ids por tipo
+    to_add = {kind: set() for kind in FAVORITE_TARGETS}
+    to_remove = {kind: set() for kind in FAVORITE_TARGETS}
+    errors = []
+    for action, grouped in (("add", to_add), ("remove", to_remove)):
+        for index, item in enumerate(data.get(action) or []):
+            kind = item.get("type") if isinstance(item, dict) else None
+            target_id = item.get("id") if isinstance(item, dict) else None
+            if kind not in FAVORITE_TARGETS or isinstance(target_id, bool) or not isinstance(target_id, int):
+                errors.append({"action": action, "index": index, "msg": "expected {type, id}"})
+                continue
+            grouped[kind].add(target_id)
+
+    if errors:
+        return jsonify({"msg": "Invalid favorites", "errors": errors}), 400
+
+    user = User.query.filter_by(id=id).first()
+
+    if user is None:
+        return jsonify({"msg": "User not found"}), 404
+
+    # un IN por tipo para validar que existen
+    for kind, ids in to_add.items():
+        if not ids:
+            continue
+        model = FAVORITE_TARGETS[kind]
+        found = set(db.session.scalars(db.select(model.id).where(model.id.in_(ids))))
+        errors.extend({"type": kind, "id": missing, "msg": "%s not found" % kind} for missing in sorted(ids - found))
+
+    if errors:
+        return jsonify({"msg": "Favorites not found", "errors": errors}), 404
+
+    # favoritos actuales del usuario que tocan este batch
+    touched = [
+        getattr(Favorites, kind + "_id").in_(to_add[kind] | to_remove[kind])
+        for kind in FAVORITE_TARGETS if to_add[kind] or to_remove[kind]
+    ]
+    current = Favorites.query.filter(Favorites.user_id == id, or_(*touched)).all()
+
+    removed = 0
+    existing = {kind: set() for kind in FAVORITE_TARGETS}
+    for favorite in current:
+        for kind in FAVORITE_TARGETS:
+            target_id = getattr(favorite, kind + "_id")
+            if target_id is None:
+                continue
+            if target_id in to_remove[kind]:
+                db.session.delete(favorite)
+                removed += 1
+            else:
+                existing[kind].add(target_id)
+
+    added = 0
+    for kind, ids in to_add.items():
+        for target_id in sorted(ids - existing[kind] - to_remove[kind]):
+            db.session.add(Favorites(user_id=id, **{kind + "_id": target_id}))
+            added += 1
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # another request changed the same favorites in the meantime
+        db.session.rollback()
+        return jsonify({"msg": "Favorites changed concurrently, try again"}), 409
+
+    response_body = {
+        "msg": "Favorites updated",
+        "added": added,
+        "removed": removed
+    }
+
+    return jsonify(response_body), 200
+
 # *********** DELETE ************
 
 # Delete an item on the favorite list of a specific user
-@app.route('/favorite/<int:favoriteid>/<int:userid>', methods=['DELETE'])
+@api.route('/favorite/<int:favoriteid>/<int:userid>', methods=['DELETE'])
 def delete_planet_id(userid, favoriteid):
 
     user = User.query.filter_by(id=userid).first()
@@ -435,9 +745,7 @@ def delete_planet_id(userid, favoriteid):
     if favorite_to_delete is None:
         return jsonify({"msg": "Favorite not found"}), 404
 
-    
-    print(favorite_to_delete.serialize())
-    
+    # counters.py decrements the target's favorites_count in the same commit
     db.session.delete(favorite_to_delete)
     db.session.commit()
 
@@ -448,7 +756,16 @@ def delete_planet_id(userid, favoriteid):
     return jsonify(response_body), 200
 
 
+def __getattr__(name):
+    # `app` (flask run, `from app import app`) is the APP_PROFILE app, built on
+    # first use so that importing create_app alone does not build one
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
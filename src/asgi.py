@@ -0,0 +1,243 @@
+"""
+ASGI entry point. The read routes run as coroutines over SQLAlchemy's
+asyncio engine (aiosqlite / asyncpg), every other request goes to the Flask
+app mounted as WSGI.
+
+    uvicorn asgi:application --app-dir src --workers 4
+    gunicorn asgi:application --chdir ./src/ -k uvicorn.workers.UvicornWorker
+
+Async views run inside a Flask request context, so argument parsing,
+filters, ETags, compression and the after_request hooks are the same code
+as the sync routes and the payloads are identical. Plain catalog lists
+served by the snapshot and ?stream= lists stay on the Flask side. The
+Flask app is src/wsgi.py's, the production profile by default.
+"""
+import io
+from functools import wraps
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import request, jsonify, current_app, g
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from wsgi import app
+from cache import lookup, store
+from database import async_database_url, async_engine_options
+from etags import make_etag
+from filters import apply_filters, requested_sort
+from models import User, Planet, Character, Vehicle, Favorites, entity_columns, entity_versions
+from querystats import watch_engine
+from snapshot import servable
+from utils import select_fields, page_query, next_page, requested_fields, project, wants_stream
+
+engine = create_async_engine(
+    async_database_url(app.config['SQLALCHEMY_DATABASE_URI']),
+    **async_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+watch_engine(engine.sync_engine)
+
+wsgi = WSGIMiddleware(app)
+
+
+def conditional(*tables):
+    """etags.conditional() for async views, the versions query runs on the async session."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(session, *args, **kwargs):
+            etag = await session.run_sync(make_etag, tables)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(await view(session, *args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = current_app.config["CACHE_CONTROL"]
+            return response
+        return wrapper
+    return decorator
+
+
+async def list_catalog(session, model, msg, not_found):
+    sort = requested_sort(model)
+    query, serialize = select_fields(model, sort)
+    query = apply_filters(query, model)
+    query, limit = page_query(query, model, sort)
+    items, next_cursor = next_page((await session.execute(query.statement)).all(), limit, sort)
+
+    if not items:
+        return ({"msg": not_found}), 404
+
+    response_body = {
+        "msg": msg,
+        "results": list(map(serialize, items)),
+        "next": next_cursor
+    }
+    return jsonify(response_body), 200
+
+
+async def get_one(session, model, id, msg, not_found):
+    # cache.get_serialized() with an async fetch, same cache and same dict
+    fields = requested_fields(entity_columns(model))
+    # the versions conditional() just read, on this session
+    version = tuple(g.table_versions[name] for name in entity_versions(model))
+    serialized = lookup(model, id, version)
+    if serialized is None:
+        columns = entity_columns(model)
+        row = (await session.execute(select(*columns.values()).where(model.id == id))).first()
+        if row is None:
+            return jsonify({"msg": not_found}), 404
+        serialized = dict(zip(columns, row))
+        store(model, id, version, serialized)
+
+    response_body = {
+        "msg": msg,
+        "result": project(serialized, fields)
+    }
+    return jsonify(response_body), 200
+
+
+def on_database():
+    # the snapshot and the streamed lists are served by the Flask views
+    return not wants_stream() and not (current_app.config["SNAPSHOT_ENABLED"] and servable())
+
+
+@conditional('user')
+async def get_all_users(session):
+    query, serialize = select_fields(User)
+    query, limit = page_query(query, User)
+    all_users, next_cursor = next_page((await session.execute(query.statement)).all(), limit)
+
+    if not all_users:
+        return ({"msg": "Users not found"}), 404
+
+    response_body = {
+        "msg": "Hello, this is your GET /user response ",
+        "results": list(map(serialize, all_users)),
+        "next": next_cursor
+    }
+    return jsonify(response_body), 200
+
+
+@conditional('user')
+async def get_one_user(session, id):
+    return await get_one(session, User, id, "Hello, this is your GET /user/id response ", "User not found")
+
+
+@conditional('planet')
+async def get_all_planets(session):
+    return await list_catalog(session, Planet, "Hello, this is your GET /planets response ", "Planets not found")
+
+
+@conditional('character')
+async def get_all_characters(session):
+    return await list_catalog(session, Character, "Hello, this is your GET /characters response ", "Characters not found")
+
+
+@conditional('vehicle')
+async def get_all_vehicles(session):
+    return await list_catalog(session, Vehicle, "Hello, this is your GET /vehicles response ", "Vehicles not found")
+
+
+@conditional('character', 'character.favorites_count')
+async def get_one_character(session, id):
+    return await get_one(session, Character, id, "Hello, this is your GET /character/id response ", "Not found")
+
+
+@conditional('planet', 'planet.favorites_count')
+async def get_one_planet(session, id):
+    return await get_one(session, Planet, id, "Hello, this is your GET /planet/id response ", "Planet not found")
+
+
+@conditional('vehicle', 'vehicle.favorites_count')
+async def get_one_vehicle(session, id):
+    return await get_one(session, Vehicle, id, "Hello, this is your GET /vehicle/id response ", "Vehicle not found")
+
+
+@conditional('user', 'favorites', 'character', 'planet', 'vehicle')
+async def get_user_favorites(session, id):
+    fields = requested_fields(Favorites.serialize_fields)
+
+    if (await session.execute(select(User.id).where(User.id == id))).first() is None:
+        return jsonify({"msg": "User not found"}), 404
+
+    query = Favorites.query_with_names(fields).filter(Favorites.user_id == id).order_by(Favorites.id)
+    favorites = (await session.execute(query.statement)).all()
+
+    if not favorites:
+        return jsonify({"msg": "No favorites found"}), 404
+
+    response_body = {
+        "msg": "Hello, this is your GET /vehicles response ",
+        "results": [Favorites.serialize_row(favorite) for favorite in favorites]
+    }
+    return jsonify(response_body), 200
+
+
+# Flask endpoint (routes of app.api) -> (async view, whether it takes this request)
+ASYNC_VIEWS = {
+    "api.get_all_users": (get_all_users, None),
+    "api.get_one_user": (get_one_user, None),
+    "api.get_all_planets": (get_all_planets, on_database),
+    "api.get_all_characters": (get_all_characters, on_database),
+    "api.get_all_vehicles": (get_all_vehicles, on_database),
+    "api.get_one_character": (get_one_character, None),
+    "api.get_one_planet": (get_one_planet, None),
+    "api.get_one_vehicle": (get_one_vehicle, None),
+    "api.get_user_favorites": (get_user_favorites, None),
+}
+
+
+async def dispatch(environ):
+    """Run the async view of the request like Flask's full_dispatch_request(),
+    None when the request belongs to the WSGI app."""
+    with app.request_context(environ):
+        if request.routing_exception is not None:
+            return None
+        view, accepts = ASYNC_VIEWS.get(request.endpoint, (None, None))
+        if view is None or (accepts is not None and not accepts()):
+            return None
+
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                async with Session() as session:
+                    rv = await view(session, **request.view_args)
+            response = app.make_response(rv)
+        except Exception as error:
+            response = app.make_response(app.handle_user_exception(error))
+        response = app.process_response(response)
+        # read inside the request context, the body may be computed lazily
+        return response.status_code, response.headers.to_wsgi_list(), response.get_data()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    if scope["type"] == "http" and scope["method"] == "GET":
+        result = await dispatch(build_environ(scope, io.BytesIO()))
+        if result is not None:
+            status, headers, body = result
+            await send({
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+    await wsgi(scope, receive, send)
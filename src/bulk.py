@@ -0,0 +1,139 @@
+"""
+Validation and batched inserts for the bulk create endpoints.
+"""
+from sqlalchemy import insert, select, Integer, String, Boolean
+from models import db, fill_numeric
+from etags import bump_versions
+from snapshot import mark_written
+
+
+def writable_columns(model):
+    shadows = {field + "_num" for field in getattr(model, "numeric_fields", ())}
+    shadows.update(getattr(model, "counter_fields", ()))
+    return [column for column in model.__table__.columns if not column.primary_key and column.key not in shadows]
+
+
+def type_error(column, value):
+    if value is None:
+        return None if column.nullable else "%s is required" % column.name
+    if isinstance(column.type, String):
+        if not isinstance(value, str):
+            return "%s must be a string" % column.name
+        if column.type.length and len(value) > column.type.length:
+            return "%s is longer than %d characters" % (column.name, column.type.length)
+    elif isinstance(column.type, Boolean):
+        if not isinstance(value, bool):
+            return "%s must be a boolean" % column.name
+    elif isinstance(column.type, Integer):
+        if isinstance(value, bool) or not isinstance(value, int):
+            return "%s must be an integer" % column.name
+    return None
+
+
+def _existing(column, values, chunk_size):
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        found.update(db.session.scalars(select(column).where(column.in_(chunk))))
+    return found
+
+
+def validate_items(model, items, chunk_size):
+    """Return (rows, errors): rows is a list of (index, values) ready to insert,
+    errors a list of {"index", "msg"} for the items that were rejected."""
+    columns = {column.name: column for column in writable_columns(model)}
+    rows = []
+    errors = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "msg": "item must be an object"})
+            continue
+        unknown = sorted(set(item) - set(columns))
+        if unknown:
+            errors.append({"index": index, "msg": "unknown fields: %s" % ", ".join(unknown)})
+            continue
+        values = {name: item.get(name) for name in columns}
+        problem = next(
+            (error for error in (type_error(columns[name], value) for name, value in values.items()) if error),
+            None
+        )
+        if problem:
+            errors.append({"index": index, "msg": problem})
+            continue
+        rows.append((index, values))
+
+    # unique columns: one IN query per chunk plus duplicates inside the batch
+    for column in columns.values():
+        if not column.unique:
+            continue
+        taken = _existing(column, {values[column.name] for _, values in rows}, chunk_size)
+        accepted = []
+        for index, values in rows:
+            if values[column.name] in taken:
+                errors.append({"index": index, "msg": "%s %r already exists" % (column.name, values[column.name])})
+            else:
+                taken.add(values[column.name])
+                accepted.append((index, values))
+        rows = accepted
+
+    # foreign keys: make sure every referenced row exists
+    for column in columns.values():
+        for foreign_key in column.foreign_keys:
+            referenced = {values[column.name] for _, values in rows if values[column.name] is not None}
+            known = _existing(foreign_key.column, referenced, chunk_size)
+            accepted = []
+            for index, values in rows:
+                if values[column.name] is not None and values[column.name] not in known:
+                    errors.append({"index": index, "msg": "%s %r not found" % (column.name, values[column.name])})
+                else:
+                    accepted.append((index, values))
+            rows = accepted
+
+    errors.sort(key=lambda error: error["index"])
+    return rows, errors
+
+
+def insert_rows(model, rows, chunk_size):
+    """Insert the validated rows in chunks inside the current transaction and
+    return the new ids in the same order."""
+    ids = []
+    # sort_by_parameter_order falls back to one INSERT per row on SQLite, where
+    # the autoincrement ids of a multi-row insert follow the parameter order
+    sqlite = db.session.get_bind().dialect.name == "sqlite"
+    statement = insert(model).returning(model.id, sort_by_parameter_order=not sqlite)
+    for start in range(0, len(rows), chunk_size):
+        chunk = [fill_numeric(model, dict(values)) for _, values in rows[start:start + chunk_size]]
+        new_ids = db.session.scalars(statement, chunk)
+        ids.extend(sorted(new_ids) if sqlite else new_ids)
+    # Core inserts skip the ORM flush hooks, so bump the ETag counter here
+    bump_versions(db.session.connection(), {model.__table__.name})
+    mark_written(db.session, model, ids)
+    return ids
+
+
+def create_many(model, items, atomic, chunk_size):
+    """Validate and insert items in one transaction.
+
+    Invalid items are reported per index and skipped, unless atomic is set,
+    in which case any error rejects the whole batch.
+    """
+    rows, errors = validate_items(model, items, chunk_size)
+    if errors and (atomic or not rows):
+        db.session.rollback()
+        return {"msg": "No items created", "errors": errors}, 400
+
+    ids = insert_rows(model, rows, chunk_size)
+    db.session.commit()
+
+    created = [None] * len(items)
+    for (index, _), new_id in zip(rows, ids):
+        created[index] = new_id
+
+    response_body = {
+        "msg": "Created %d of %d items" % (len(ids), len(items)),
+        "ids": created,
+        "errors": errors
+    }
+    return response_body, 201
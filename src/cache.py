@@ -0,0 +1,156 @@
+"""
+In-process LRU + TTL cache for serialized single-entity payloads.
+
+Every gunicorn worker keeps its own cache. Each entry carries the
+table_version of its table and of its counters it was read at, and only
+answers requests made at those same versions, so writes from other workers,
+the importer or the admin are never served stale under a new ETag. Writes
+made through this process also drop the affected entries on commit.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import g
+from sqlalchemy import select
+from models import db, listen_once, entity_columns, entity_versions
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize, ttl):
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+entity_cache = LRUCache()
+
+
+def cache_key(model, id):
+    return (model.__name__, id)
+
+
+def request_version(session, model):
+    """table_version of model and of its counters this request's ETag was built
+    from (see etags.make_etag())."""
+    names = entity_versions(model)
+    versions = g.get("table_versions", {})
+    if not all(name in versions for name in names):
+        # etags -> compress -> cache, import it late
+        from etags import get_versions
+        return tuple(get_versions(session, list(names)))
+    return tuple(versions[name] for name in names)
+
+
+def lookup(model, id, version):
+    """The cached serialize() of id read at version, None otherwise."""
+    entry = entity_cache.get(cache_key(model, id))
+    if entry is None or entry[0] != version:
+        return None
+    return entry[1]
+
+
+def store(model, id, version, serialized):
+    entity_cache.set(cache_key(model, id), (version, serialized))
+
+
+def get_serialized(model, id):
+    """Return the entity_columns() of the given id, from the cache when possible.
+
+    Returns None when the row does not exist (misses are not cached).
+    """
+    version = request_version(db.session, model)
+    serialized = lookup(model, id, version)
+    if serialized is None:
+        columns = entity_columns(model)
+        row = db.session.execute(select(*columns.values()).where(model.id == id)).first()
+        if row is None:
+            return None
+        serialized = dict(zip(columns, row))
+        store(model, id, version, serialized)
+    return serialized
+
+
+def _collect_written(session, flush_context):
+    keys = session.info.setdefault("cache_keys", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys.add(cache_key(type(obj), obj.id))
+
+
+def invalidate_on_commit(session, model, ids):
+    """Drop the entries of a Core write on commit, the flush hooks do not see it."""
+    session.info.setdefault("cache_keys", set()).update(cache_key(model, id) for id in ids)
+
+
+def _invalidate_written(session):
+    for key in session.info.pop("cache_keys", ()):
+        entity_cache.invalidate(key)
+
+
+def _forget_written(session):
+    session.info.pop("cache_keys", None)
+
+
+def setup_cache(app, session):
+    entity_cache.configure(
+        app.config.get("ENTITY_CACHE_SIZE", 1024),
+        app.config.get("ENTITY_CACHE_TTL", 300)
+    )
+    # ORM writes from the API and from flask-admin both go through this session
+    listen_once(session, "after_flush", _collect_written)
+    listen_once(session, "after_commit", _invalidate_written)
+    listen_once(session, "after_rollback", _forget_written)
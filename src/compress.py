@@ -0,0 +1,118 @@
+"""
+Response compression negotiated on Accept-Encoding.
+
+gzip is always available, brotli ("br") and zstd are used when the brotli /
+zstandard packages are installed. Responses under COMPRESS_MIN_SIZE are sent
+as is. Compressed bodies of responses carrying an ETag are kept in an LRU
+keyed by (ETag, encoding), so a hot response is compressed only once;
+etags.make_etag() already varies the ETag with the negotiated encoding.
+"""
+import gzip
+import zlib
+from flask import request, current_app
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/html", "text/plain", "text/csv")
+
+compressed_cache = LRUCache()
+
+
+def available_encodings():
+    # server preference when the client accepts several with the same quality
+    encodings = []
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate():
+    """The Content-Encoding to use for this request, None for identity."""
+    if not current_app.config["COMPRESS_ENABLED"]:
+        return None
+    return request.accept_encodings.best_match(available_encodings())
+
+
+def compress(data, encoding, config):
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=config["COMPRESS_LEVEL_GZIP"], mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESS_LEVEL_BR"])
+    return zstandard.ZstdCompressor(level=config["COMPRESS_LEVEL_ZSTD"]).compress(data)
+
+
+class _StreamCompressor:
+
+    def __init__(self, encoding, config):
+        if encoding == "gzip":
+            compressor = zlib.compressobj(config["COMPRESS_LEVEL_GZIP"], zlib.DEFLATED, 31)
+            self.compress, self.finish = compressor.compress, compressor.flush
+        elif encoding == "br":
+            compressor = brotli.Compressor(quality=config["COMPRESS_LEVEL_BR"])
+            self.compress, self.finish = compressor.process, compressor.finish
+        else:
+            compressor = zstandard.ZstdCompressor(level=config["COMPRESS_LEVEL_ZSTD"]).compressobj()
+            self.compress, self.finish = compressor.compress, compressor.flush
+
+
+def _compress_stream(chunks, encoding, config):
+    compressor = _StreamCompressor(encoding, config)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _compress_response(response):
+    if response.mimetype not in COMPRESSIBLE:
+        return response
+    response.vary.add("Accept-Encoding")
+
+    if (request.method == "HEAD" or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers):
+        return response
+    encoding = negotiate()
+    if encoding is None:
+        return response
+    config = current_app.config
+
+    if response.is_streamed:
+        # unknown size: compress chunk by chunk, memory stays flat
+        response.response = _compress_stream(response.iter_encoded(), encoding, config)
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    data = response.get_data()
+    if len(data) < config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    etag, weak = response.get_etag()
+    key = (etag, encoding)
+    body = compressed_cache.get(key) if etag and not weak else None
+    if body is None:
+        body = compress(data, encoding, config)
+        if etag and not weak:
+            compressed_cache.set(key, body)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def setup_compression(app):
+    compressed_cache.configure(app.config["COMPRESS_CACHE_SIZE"], app.config["COMPRESS_CACHE_TTL"])
+    app.after_request(_compress_response)
@@ -0,0 +1,99 @@
+"""
+favorites_count of planets, characters and vehicles, kept by the writes.
+
+The flush that adds, removes or retargets Favorites rows also runs one
+UPDATE ... SET favorites_count = favorites_count + :delta per target table,
+in the same transaction, so concurrent likes never lose an increment and a
+rollback undoes both. The counters are left out of the list payloads and
+the snapshots, a like only bumps the "<table>.favorites_count" version
+that the entity routes and /favorites/top add to their ETags, and drops
+the cached entities of the targets.
+
+GET /favorites/top reads the counter through the (favorites_count, id)
+index instead of grouping Favorites on every request.
+"""
+from collections import Counter
+from sqlalchemy import inspect, update, bindparam, func, select
+from models import db, listen_once, Favorites, FAVORITE_TARGETS, counter_version, entity_columns
+from etags import bump_versions
+from cache import invalidate_on_commit
+
+
+def favorite_deltas(session):
+    """favorite type -> Counter(target id -> favorites added minus removed) of the flush."""
+    deltas = {kind: Counter() for kind in FAVORITE_TARGETS}
+    for obj in session.new:
+        if isinstance(obj, Favorites):
+            for kind in FAVORITE_TARGETS:
+                if getattr(obj, kind + "_id") is not None:
+                    deltas[kind][getattr(obj, kind + "_id")] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Favorites):
+            for kind in FAVORITE_TARGETS:
+                # the value stored in the row, even if changed before the delete
+                history = inspect(obj).attrs[kind + "_id"].history
+                for target_id in history.unchanged or history.deleted:
+                    if target_id is not None:
+                        deltas[kind][target_id] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Favorites) and obj not in session.deleted:
+            for kind in FAVORITE_TARGETS:
+                history = inspect(obj).attrs[kind + "_id"].history
+                for target_id in history.added:
+                    if target_id is not None:
+                        deltas[kind][target_id] += 1
+                for target_id in history.deleted:
+                    if target_id is not None:
+                        deltas[kind][target_id] -= 1
+    return deltas
+
+
+def _update_counts(session, flush_context):
+    for kind, counts in favorite_deltas(session).items():
+        # sorted, concurrent transactions lock the rows in the same order
+        changed = sorted((target_id, delta) for target_id, delta in counts.items() if delta)
+        if not changed:
+            continue
+        model = FAVORITE_TARGETS[kind]
+        table = model.__table__
+        connection = session.connection()
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("target_id"))
+            .values(favorites_count=table.c.favorites_count + bindparam("delta")),
+            [{"target_id": target_id, "delta": delta} for target_id, delta in changed]
+        )
+        bump_versions(connection, {counter_version(model, "favorites_count")})
+        invalidate_on_commit(session, model, [target_id for target_id, _ in changed])
+
+
+def recount_favorites(connection):
+    """Recompute every counter from Favorites, after writes that skipped the ORM."""
+    for kind, model in FAVORITE_TARGETS.items():
+        table = model.__table__
+        count = (
+            select(func.count())
+            .select_from(Favorites.__table__)
+            .where(getattr(Favorites.__table__.c, kind + "_id") == table.c.id)
+            .scalar_subquery()
+        )
+        connection.execute(update(table).values(favorites_count=count))
+    bump_versions(connection, {counter_version(model, "favorites_count") for model in FAVORITE_TARGETS.values()})
+
+
+def top_favorites(model, limit):
+    """Rows of the limit most liked model instances (ties: newest first) and the serializer."""
+    columns = entity_columns(model)
+    query = (
+        db.session.query(*columns.values())
+        .filter(model.favorites_count > 0)
+        .order_by(model.favorites_count.desc(), model.id.desc())
+        .limit(limit)
+    )
+    keys = tuple(columns)
+    return query.all(), lambda row: dict(zip(keys, row))
+
+
+def setup_counters(app, session):
+    # after the Favorites rows are written, in the flush's transaction
+    listen_once(session, "after_flush", _update_counts)
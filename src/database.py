@@ -0,0 +1,112 @@
+"""
+Engine and connection pool settings, driven by environment variables.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS, DB_QUERY_CACHE_SIZE,
+    SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT_MS, DB_POOL_WARM
+
+SQLite connections (the /tmp/test.db fallback) are switched to WAL with
+synchronous=NORMAL, memory-mapped I/O, a busy timeout and foreign keys.
+
+async_database_url() / async_engine_options() are the asyncio engine
+equivalents (aiosqlite / asyncpg) used by src/asgi.py.
+"""
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from metrics import TimedQueuePool
+
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def database_url():
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        return db_url.replace("postgres://", "postgresql://")
+    return "sqlite:////tmp/test.db"
+
+
+def engine_options(url):
+    url = make_url(url)
+    options = {
+        "pool_pre_ping": _flag("DB_POOL_PRE_PING", "true"),
+        # compiled statement cache, shared by every connection of the engine
+        "query_cache_size": int(os.getenv("DB_QUERY_CACHE_SIZE", 500)),
+    }
+
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # in-memory databases live in a single connection, keep Flask-SQLAlchemy's pool
+        return options
+
+    options.update({
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        # recycle before Render / pgbouncer drop idle connections
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    })
+
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+    if url.get_backend_name() == "postgresql" and statement_timeout:
+        options["connect_args"] = {"options": "-c statement_timeout=%d" % statement_timeout}
+    return options
+
+
+def warm_pool(engine, size=None):
+    """Open DB_POOL_WARM connections up front, so the first requests skip the connect."""
+    size = int(os.getenv("DB_POOL_WARM", 1)) if size is None else size
+    if hasattr(engine.pool, "size"):
+        size = min(size, engine.pool.size())
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def async_database_url(url):
+    url = make_url(url)
+    drivers = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+    return url.set(drivername=drivers.get(url.get_backend_name(), url.drivername))
+
+
+def async_engine_options(url):
+    options = engine_options(url)
+    # asyncio engines need their own pool class, AsyncAdaptedQueuePool is the default
+    options.pop("poolclass", None)
+    if "connect_args" in options:
+        # asyncpg takes server settings instead of libpq "options"
+        statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout)}}
+    return options
+
+
+def _is_sqlite(dbapi_connection):
+    # aiosqlite connections are wrapped by SQLAlchemy's sync adapter
+    return (isinstance(dbapi_connection, sqlite3.Connection)
+            or type(dbapi_connection).__module__ == "sqlalchemy.dialects.sqlite.aiosqlite")
+
+
+@event.listens_for(Engine, "connect")
+def configure_sqlite(dbapi_connection, connection_record):
+    if not _is_sqlite(dbapi_connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # the favorite POSTs rely on foreign keys, SQLite only checks them when asked to
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout=%d" % int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)))
+    # execute() returning the cursor is a sqlite3 extension, aiosqlite's adapter does not
+    cursor.execute("PRAGMA database_list")
+    if cursor.fetchone()[2]:
+        # only file databases support WAL and mmap
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=%d" % int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)))
+    cursor.close()
+
@@ -0,0 +1,92 @@
+"""
+Strong ETags and conditional GETs driven by per-table generation counters.
+
+Every ORM flush bumps the table_version row of the tables it touched, inside
+the same transaction, so the counters are shared by all gunicorn workers.
+A GET computes its ETag from those counters (one primary-key query) and
+answers 304 before running the real query when the client is up to date.
+"""
+import hashlib
+from functools import wraps
+from flask import request, current_app, g
+from sqlalchemy import select, update, insert
+from models import db, listen_once, TableVersion
+from compress import negotiate
+
+table_version = TableVersion.__table__
+
+
+def bump_versions(connection, tables):
+    """Increment the generation counter of each table name in tables."""
+    for name in sorted(tables):
+        result = connection.execute(
+            update(table_version)
+            .where(table_version.c.name == name)
+            .values(version=table_version.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table_version).values(name=name, version=1))
+
+
+def get_versions(session, tables):
+    rows = session.execute(
+        select(table_version.c.name, table_version.c.version)
+        .where(table_version.c.name.in_(tables))
+    )
+    versions = dict(rows.all())
+    return [versions.get(name, 0) for name in tables]
+
+
+def compute_etag(tables, versions):
+    # the same tables can back several representations of a route
+    key = "%s|%s|%s|%s" % (
+        ",".join("%s:%s" % pair for pair in zip(tables, versions)),
+        request.full_path,
+        request.accept_mimetypes.best,
+        negotiate()
+    )
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def make_etag(session, tables):
+    versions = get_versions(session, tables)
+    # cache.get_serialized() answers from the versions of this ETag
+    g.table_versions = dict(zip(tables, versions))
+    return compute_etag(tables, versions)
+
+
+def conditional(*tables):
+    """Decorate a GET view with ETag / If-None-Match handling for tables."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = make_etag(db.session, tables)
+            cache_control = current_app.config["CACHE_CONTROL"]
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
+def _bump_written(session, flush_context):
+    dirty = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    tables = {
+        obj.__table__.name
+        for obj in list(session.new) + dirty + list(session.deleted)
+        if not isinstance(obj, TableVersion)
+    }
+    if tables:
+        bump_versions(session.connection(), tables)
+
+
+def setup_etags(app, session):
+    listen_once(session, "after_flush", _bump_written)
@@ -0,0 +1,129 @@
+"""
+Full table exports as NDJSON or CSV, for the `flask export-data` command
+and the GET /export/<table> endpoint (Authorization: Bearer EXPORT_TOKEN).
+
+Rows come from a server-side cursor (stream_results) and are written in
+chunks of STREAM_CHUNK_SIZE, so memory stays flat whatever the table size.
+All the tables of one export are read in a single snapshot: a REPEATABLE
+READ read-only transaction on Postgres, a read transaction on SQLite.
+Favorites carry their target names through the query_with_names() joins.
+"""
+import csv
+import gzip
+import hmac
+import io
+import os
+import click
+from flask import current_app, request, Response, stream_with_context
+from sqlalchemy import select
+from models import db, User, Planet, Character, Vehicle, Favorites, serialized_columns
+from utils import APIException, NDJSON_MIMETYPE
+
+EXPORTS = {
+    "users": User,
+    "planets": Planet,
+    "characters": Character,
+    "vehicles": Vehicle,
+    "favorites": Favorites
+}
+
+FORMATS = {"ndjson": NDJSON_MIMETYPE, "csv": "text/csv"}
+
+
+def export_query(table):
+    """(statement, field names) of an export, in id order."""
+    model = EXPORTS[table]
+    if model is Favorites:
+        return Favorites.query_with_names().order_by(Favorites.id).statement, Favorites.serialize_fields
+    columns = serialized_columns(model)
+    return select(*columns.values()).order_by(model.id), tuple(columns)
+
+
+def snapshot_connection():
+    """A connection inside a transaction that sees one snapshot of the database."""
+    connection = db.engine.connect()
+    if connection.dialect.name == "postgresql":
+        connection = connection.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+    elif connection.dialect.name == "sqlite":
+        # pysqlite only opens a transaction before writes, ask for the read one explicitly
+        connection.exec_driver_sql("BEGIN")
+    return connection
+
+
+def _encode_ndjson(rows, fields, dumps):
+    # same objects as the API: favorites without their empty targets
+    if fields is Favorites.serialize_fields:
+        return "".join(dumps(Favorites.serialize_row(row)) + "\n" for row in rows)
+    return "".join(dumps(dict(zip(fields, row))) + "\n" for row in rows)
+
+
+def _encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def export_chunks(connection, table, format, chunk_size):
+    """Yield the table as text chunks of NDJSON lines or CSV rows (with a header)."""
+    statement, fields = export_query(table)
+    dumps = current_app.json.dumps
+    if format == "csv":
+        yield _encode_csv([fields])
+    result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(statement)
+    for rows in result.partitions():
+        yield _encode_csv(rows) if format == "csv" else _encode_ndjson(rows, fields, dumps)
+
+
+def check_token():
+    token = current_app.config["EXPORT_TOKEN"]
+    if not token:
+        raise APIException("Exports are disabled, set EXPORT_TOKEN", status_code=404)
+    given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(given.encode(), token.encode()):
+        raise APIException("Invalid export token", status_code=401)
+
+
+def export_response(table, format):
+    """Streamed response of one table, compressed by compress.py when the client accepts it."""
+    if table not in EXPORTS:
+        raise APIException("Unknown table %s" % table, status_code=404, payload={"allowed": list(EXPORTS)})
+    if format not in FORMATS:
+        raise APIException("Unknown format %s" % format, status_code=400, payload={"allowed": list(FORMATS)})
+    chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+
+    def generate():
+        connection = snapshot_connection()
+        try:
+            yield from export_chunks(connection, table, format, chunk_size)
+        finally:
+            connection.rollback()
+            connection.close()
+
+    response = Response(stream_with_context(generate()), mimetype=FORMATS[format])
+    response.headers["Content-Disposition"] = "attachment; filename=%s.%s" % (table, format)
+    return response
+
+
+def setup_export(app):
+
+    @app.cli.command("export-data")
+    @click.argument("tables", nargs=-1, type=click.Choice(list(EXPORTS)))
+    @click.option("--format", "format", type=click.Choice(list(FORMATS)), default="ndjson", show_default=True)
+    @click.option("--gzip", "compress", is_flag=True, help="write .gz files")
+    @click.option("--output-dir", default=".", show_default=True, type=click.Path(file_okay=False))
+    def export_data(tables, format, compress, output_dir):
+        """Export tables (all of them by default) as NDJSON or CSV files, from one snapshot."""
+        os.makedirs(output_dir, exist_ok=True)
+        chunk_size = app.config["STREAM_CHUNK_SIZE"]
+        connection = snapshot_connection()
+        try:
+            for table in tables or EXPORTS:
+                path = os.path.join(output_dir, "%s.%s%s" % (table, format, ".gz" if compress else ""))
+                opener = gzip.open if compress else open
+                with opener(path, "wt", encoding="utf-8", newline="") as handle:
+                    for chunk in export_chunks(connection, table, format, chunk_size):
+                        handle.write(chunk)
+                click.echo("%s: %s" % (table, path))
+        finally:
+            connection.rollback()
+            connection.close()
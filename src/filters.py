@@ -0,0 +1,93 @@
+"""
+Declarative filters and sorting for the catalog list routes.
+
+    ?gender=male                 equality
+    ?eye_color_in=blue,brown     IN list
+    ?name_prefix=Lu              prefix match
+    ?population_gt=1e9           numeric range: _gt, _gte, _lt, _lte
+    ?sort=name / ?sort=-height   order by any field, id breaks ties
+
+Field names are the serialized ones (e.g. "planet" for Character.planet_id).
+Ranges and sorting on numeric fields use the parsed "<field>_num" columns.
+"""
+import math
+from flask import request
+from sqlalchemy import Integer, Boolean
+from models import serialized_columns, numeric_columns
+from utils import APIException
+
+# query parameters handled by pagination, streaming and fieldsets
+RESERVED = ("limit", "after", "all", "stream", "fields", "sort")
+OPERATORS = ("in", "prefix", "gte", "lte", "gt", "lt")
+RANGES = {
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value
+}
+
+
+def _coerce(name, column, raw):
+    if isinstance(column.type, Boolean):
+        return raw.lower() in ("1", "true", "yes")
+    if isinstance(column.type, Integer):
+        try:
+            return int(raw)
+        except ValueError:
+            raise APIException("%s must be an integer" % name, status_code=400)
+    return raw
+
+
+def _split(param, columns):
+    if param in columns:
+        return param, None
+    for operator in OPERATORS:
+        suffix = "_" + operator
+        if param.endswith(suffix) and param[:-len(suffix)] in columns:
+            return param[:-len(suffix)], operator
+    raise APIException("Unknown filter: %s" % param, status_code=400, payload={"allowed": list(columns)})
+
+
+def _number(name, raw):
+    try:
+        number = float(raw)
+    except ValueError:
+        number = None
+    if number is None or not math.isfinite(number):
+        raise APIException("%s must be a number" % name, status_code=400)
+    return number
+
+
+def apply_filters(query, model):
+    columns = serialized_columns(model)
+    numeric = numeric_columns(model)
+    for param, raw in request.args.items(multi=True):
+        if param in RESERVED:
+            continue
+        name, operator = _split(param, columns)
+        column = columns[name]
+        if operator in RANGES:
+            if name not in numeric:
+                raise APIException("%s is not a numeric field" % name, status_code=400, payload={"allowed": list(numeric)})
+            query = query.filter(RANGES[operator](numeric[name], _number(param, raw)))
+        elif operator is None:
+            query = query.filter(column == _coerce(name, column, raw))
+        elif operator == "in":
+            query = query.filter(column.in_([_coerce(name, column, value) for value in raw.split(",")]))
+        else:
+            query = query.filter(column.startswith(raw, autoescape=True))
+    return query
+
+
+def requested_sort(model):
+    """Return (name, column, descending) for ?sort=, None when absent."""
+    raw = request.args.get("sort")
+    if not raw:
+        return None
+    name = raw[1:] if raw.startswith("-") else raw
+    columns = serialized_columns(model)
+    if name not in columns:
+        raise APIException("Unknown sort field: %s" % name, status_code=400, payload={"allowed": list(columns)})
+    # numeric strings sort by their parsed value ("9" < "10")
+    column = numeric_columns(model).get(name, columns[name])
+    return name, column, raw.startswith("-")
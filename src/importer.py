@@ -0,0 +1,326 @@
+"""
+`flask import-swapi`: bulk load SWAPI shaped dumps of planets, characters
+and vehicles.
+
+    flask import-swapi --planets planets.json --characters people.ndjson --vehicles vehicles.json --upsert
+
+Files are JSON arrays, SWAPI pages ({"results": [...]}) or NDJSON, read as
+a stream. Every batch is one transaction: executemany inserts on SQLite,
+COPY on Postgres. With --upsert rows whose name already exists are updated
+instead of skipped. A character's homeworld may be a planet id, a planet
+name or a SWAPI planet url seen in an earlier planets import.
+
+Progress is kept in a state file after every committed batch, running the
+same command again after a failure resumes after the last committed batch.
+"""
+import csv
+import io
+import json
+import os
+import time
+import click
+from sqlalchemy import select, insert, update, func, bindparam
+from models import db, Planet, Character, Vehicle, fill_numeric
+from bulk import writable_columns, type_error
+from etags import bump_versions
+
+# command option -> model, in dependency order (characters reference planets)
+IMPORTS = (("planets", Planet), ("characters", Character), ("vehicles", Vehicle))
+
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_records(handle):
+    """Yield the objects of a JSON array, a {"results": [...]} page or NDJSON
+    without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = handle.read(CHUNK_SIZE)
+    start = len(buffer) - len(buffer.lstrip())
+    if buffer[start:start + 1] not in ("[", "{"):
+        raise click.ClickException("%s is not JSON" % handle.name)
+
+    if buffer[start] == "{":
+        # NDJSON when the first line is a whole object, a SWAPI page otherwise
+        try:
+            first = decoder.decode(buffer[start:].split("\n", 1)[0])
+        except ValueError:
+            first = None
+        if first is not None and not isinstance(first.get("results"), list):
+            yield from _iter_ndjson(buffer, handle, decoder)
+            return
+        while '"results"' not in buffer or "[" not in buffer[buffer.index('"results"'):]:
+            chunk = handle.read(CHUNK_SIZE)
+            if not chunk:
+                raise click.ClickException("%s has no \"results\" list" % handle.name)
+            buffer += chunk
+        start = buffer.index("[", buffer.index('"results"'))
+
+    yield from _iter_array(buffer[start + 1:], handle, decoder)
+
+
+def _iter_ndjson(buffer, handle, decoder):
+    while True:
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield decoder.decode(line)
+        chunk = handle.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+    if buffer.strip():
+        yield decoder.decode(buffer)
+
+
+def _iter_array(buffer, handle, decoder):
+    position = 0
+    while True:
+        # skip separators, refilling the buffer as needed
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            chunk = handle.read(CHUNK_SIZE)
+            if not chunk:
+                raise click.ClickException("%s ends before the list is closed" % handle.name)
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            chunk = handle.read(CHUNK_SIZE)
+            if not chunk:
+                raise click.ClickException("%s has an invalid record" % handle.name)
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield record
+        buffer, position = buffer[end:], 0
+
+
+def batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ImportState:
+    """Committed progress per input file, persisted as JSON."""
+
+    def __init__(self, path, restart):
+        self.path = path
+        self.data = {"files": {}, "planet_urls": {}}
+        if not restart and os.path.exists(path):
+            with open(path) as handle:
+                self.data = json.load(handle)
+
+    @staticmethod
+    def _identity(filename):
+        stat = os.stat(filename)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def done(self, filename):
+        entry = self.data["files"].get(os.path.abspath(filename))
+        if entry is None or entry["identity"] != self._identity(filename):
+            return 0
+        return entry["done"]
+
+    def advance(self, filename, done):
+        self.data["files"][os.path.abspath(filename)] = {"identity": self._identity(filename), "done": done}
+        # written next to the target and renamed, a crash never leaves half a file
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as handle:
+            json.dump(self.data, handle)
+        os.replace(temporary, self.path)
+
+
+def clean(model, record, columns):
+    """Keep the writable columns present in a record, and the first error: a value
+    of the wrong type or a missing required column."""
+    values = {name: record[name] for name in columns if name in record}
+    errors = (
+        type_error(column, values.get(name))
+        for name, column in columns.items() if name in values or not column.nullable
+    )
+    return values, next((error for error in errors if error), None)
+
+
+def resolve_planets(batch, state):
+    """planet_id of every character of the batch from homeworld / planet / planet_id."""
+    batch = [record for record in batch if isinstance(record, dict)]
+    references = [record.get("homeworld", record.get("planet", record.get("planet_id"))) for record in batch]
+    names = {value for value in references if isinstance(value, str) and value not in state.data["planet_urls"]}
+    ids = {value for value in references if isinstance(value, int) and not isinstance(value, bool)}
+
+    by_name = {}
+    if names:
+        rows = db.session.execute(select(Planet.name, func.min(Planet.id)).where(Planet.name.in_(names)).group_by(Planet.name))
+        by_name = dict(rows.all())
+    known = set(db.session.scalars(select(Planet.id).where(Planet.id.in_(ids)))) if ids else set()
+
+    unresolved = 0
+    for record, value in zip(batch, references):
+        if value is None:
+            # no reference at all: an upsert keeps the stored planet_id
+            continue
+        if isinstance(value, str):
+            planet_id = state.data["planet_urls"].get(value, by_name.get(value))
+        else:
+            planet_id = value if value in known else None
+        if planet_id is None:
+            unresolved += 1
+        record["planet_id"] = planet_id
+    return unresolved
+
+
+def copy_rows(model, rows):
+    """COPY the rows into the model table on the session's Postgres connection."""
+    names = list(rows[0])
+    buffer = io.StringIO()
+    # strings are quoted, so None is the only unquoted empty field: NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([row[name] for name in names])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (model.__table__.name, ", ".join(names)), buffer
+        )
+    finally:
+        cursor.close()
+
+
+def import_batch(model, batch, upsert, state):
+    """Insert / update one batch in the current transaction, returns the counters."""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "invalid": 0, "unresolved": 0}
+    columns = {column.name: column for column in writable_columns(model)}
+    if model is Character:
+        counts["unresolved"] = resolve_planets(batch, state)
+
+    # the last occurrence of a name in the batch wins
+    rows = {}
+    urls = {}
+    for record in batch:
+        if not isinstance(record, dict):
+            counts["invalid"] += 1
+            continue
+        values, error = clean(model, record, columns)
+        if error:
+            counts["invalid"] += 1
+            continue
+        rows[values["name"]] = values
+        if isinstance(record.get("url"), str):
+            urls[values["name"]] = record["url"]
+
+    existing = dict(db.session.execute(
+        select(model.name, func.min(model.id)).where(model.name.in_(list(rows))).group_by(model.name)
+    ).all()) if rows else {}
+    # inserts take every column (executemany needs the same keys in every row),
+    # updates only SET the columns the record has
+    new = [
+        fill_numeric(model, {name: values.get(name) for name in columns})
+        for name, values in rows.items() if name not in existing
+    ]
+    changed = {}
+    for name, values in rows.items():
+        if name in existing:
+            values = fill_numeric(model, dict(values))
+            # bind names must differ from the column names in an UPDATE ... SET
+            params = dict({"new_" + key: value for key, value in values.items()}, old_id=existing[name])
+            changed.setdefault(tuple(sorted(values)), []).append(params)
+
+    if new:
+        if db.engine.dialect.name == "postgresql":
+            copy_rows(model, new)
+        else:
+            db.session.execute(insert(model), new)
+        counts["inserted"] = len(new)
+    if changed and upsert:
+        table = model.__table__
+        # one executemany per set of columns
+        for keys, params in changed.items():
+            statement = (
+                update(table)
+                .where(table.c.id == bindparam("old_id"))
+                .values({key: bindparam("new_" + key) for key in keys})
+            )
+            db.session.connection().execute(statement, params)
+            counts["updated"] += len(params)
+    else:
+        counts["skipped"] = sum(len(params) for params in changed.values())
+
+    if counts["inserted"] or counts["updated"]:
+        # Core writes skip the ORM flush hooks, keep the ETags and snapshots in sync
+        bump_versions(db.session.connection(), {model.__table__.name})
+
+    if model is Planet and urls:
+        ids = dict(db.session.execute(
+            select(Planet.name, func.min(Planet.id)).where(Planet.name.in_(list(urls))).group_by(Planet.name)
+        ).all())
+        state.data["planet_urls"].update({url: ids[name] for name, url in urls.items() if name in ids})
+    return counts
+
+
+def import_file(model, filename, batch_size, upsert, state):
+    skip = state.done(filename)
+    totals = {"inserted": 0, "updated": 0, "skipped": 0, "invalid": 0, "unresolved": 0}
+    started = time.perf_counter()
+    done = skip
+
+    with open(filename, encoding="utf-8") as handle:
+        records = iter_records(handle)
+        for _ in range(skip):
+            next(records, None)
+        if skip:
+            click.echo("%s: resuming after %d records" % (filename, skip))
+
+        for batch in batches(records, batch_size):
+            try:
+                counts = import_batch(model, batch, upsert, state)
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                raise click.ClickException("%s: batch starting at record %d failed (%s), run the command again to resume" % (
+                    filename, done, str(error).splitlines()[0]
+                ))
+            done += len(batch)
+            state.advance(filename, done)
+            for key, value in counts.items():
+                totals[key] += value
+            elapsed = time.perf_counter() - started
+            click.echo("%s: %d records, %.0f rows/s" % (filename, done, (done - skip) / elapsed if elapsed else 0))
+
+    elapsed = time.perf_counter() - started
+    summary = "%d inserted, %d updated, %d skipped, %d invalid" % (
+        totals["inserted"], totals["updated"], totals["skipped"], totals["invalid"]
+    )
+    if model is Character:
+        summary += ", %d unresolved homeworlds" % totals["unresolved"]
+    click.echo("%s: %s in %.1fs (%.0f rows/s)" % (filename, summary, elapsed, (done - skip) / elapsed if elapsed else 0))
+
+
+def setup_import(app):
+
+    @app.cli.command("import-swapi")
+    @click.option("--planets", type=click.Path(exists=True, dir_okay=False), help="planets JSON / NDJSON dump")
+    @click.option("--characters", type=click.Path(exists=True, dir_okay=False), help="people JSON / NDJSON dump")
+    @click.option("--vehicles", type=click.Path(exists=True, dir_okay=False), help="vehicles JSON / NDJSON dump")
+    @click.option("--batch-size", default=1000, show_default=True, help="records per transaction")
+    @click.option("--upsert", is_flag=True, help="update the rows whose name already exists instead of skipping them")
+    @click.option("--state-file", default=".import-state.json", show_default=True, help="progress kept for resuming")
+    @click.option("--restart", is_flag=True, help="ignore the state file and import every record again")
+    def import_swapi(batch_size, upsert, state_file, restart, **files):
+        """Bulk import SWAPI shaped planets, characters and vehicles."""
+        if not any(files.values()):
+            raise click.UsageError("give at least one of --planets, --characters, --vehicles")
+        state = ImportState(state_file, restart)
+        for option, model in IMPORTS:
+            if files[option]:
+                import_file(model, files[option], batch_size, upsert, state)
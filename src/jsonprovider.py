@@ -0,0 +1,50 @@
+"""
+Flask JSON provider backed by orjson, with the stdlib provider as fallback.
+
+JSON_PROVIDER=orjson (the default) uses orjson when it is installed,
+JSON_PROVIDER=stdlib keeps Flask's DefaultJSONProvider. Both honor
+sort_keys / compact. orjson serializes datetimes, dates and uuids itself
+(datetimes as RFC 3339, where the stdlib provider writes HTTP dates), so
+the shared default() is only called for the other types, e.g. decimals.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _option(self, indent=False):
+        # non str keys are stringified like the stdlib does (int ids as keys)
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # json.dumps() arguments orjson does not know about
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        # bytes straight into the response, no intermediate str
+        data = orjson.dumps(obj, default=self.default, option=self._option(indent)) + b"\n"
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+def setup_json(app):
+    if orjson is not None and app.config["JSON_PROVIDER"] == "orjson":
+        app.json = OrjsonProvider(app)
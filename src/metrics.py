@@ -0,0 +1,106 @@
+"""
+Prometheus metrics for the API: per-endpoint request counts, status codes,
+latency histograms, in-flight requests and DB pool usage and checkout wait time.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set up in gunicorn.conf.py) and /metrics aggregates all of them.
+"""
+import os
+import time
+from flask import request, g
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "endpoint", "status"]
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent handling a request", ["method", "endpoint"],
+    buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being handled", multiprocess_mode="livesum"
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool",
+    buckets=LATENCY_BUCKETS
+)
+POOL_SIZE = Gauge(
+    "db_pool_size", "Configured connection pool size", multiprocess_mode="livesum"
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Open DB connections", multiprocess_mode="livesum"
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "DB connections currently checked out", multiprocess_mode="livesum"
+)
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long each checkout waited for a connection
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def _endpoint():
+    # the url rule keeps label cardinality bounded (/planet/<int:id>, not /planet/42)
+    return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _record(response):
+    started = g.get("metrics_started")
+    if started is not None:
+        endpoint = _endpoint()
+        LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - started)
+        REQUESTS.labels(request.method, endpoint, str(response.status_code)).inc()
+    return response
+
+
+def _finish(error=None):
+    if g.pop("metrics_started", None) is not None:
+        IN_FLIGHT.dec()
+
+
+def render_metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+
+def record_pool_size(engine):
+    # a gauge set before fork reads 0 in the workers (their samples go to
+    # per-pid files), so a preloaded app calls this again from post_fork
+    if hasattr(engine.pool, "size"):
+        POOL_SIZE.set(engine.pool.size())
+
+
+def setup_pool_metrics(engine):
+    record_pool_size(engine)
+    event.listen(engine, "connect", lambda *args: POOL_CONNECTIONS.inc())
+    event.listen(engine, "close", lambda *args: POOL_CONNECTIONS.dec())
+    event.listen(engine, "checkout", lambda *args: POOL_CHECKED_OUT.inc())
+    event.listen(engine, "checkin", lambda *args: POOL_CHECKED_OUT.dec())
+
+
+def setup_metrics(app):
+    app.before_request(_start_timer)
+    app.after_request(_record)
+    app.teardown_request(_finish)
@@ -1,7 +1,74 @@
+import math
+import re
+from operator import attrgetter
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 db = SQLAlchemy()
 
+
+def listen_once(target, identifier, fn):
+    """event.listen() that skips hooks already registered on target.
+
+    db.session is shared by every app create_app() builds (the tests build
+    several), so the setup_* functions must not stack a second copy of their
+    session hooks.
+    """
+    if not event.contains(target, identifier, fn):
+        event.listen(target, identifier, fn)
+
+
+def parse_number(value):
+    """Parse SWAPI style numbers ("1,358", "200000", "unknown") into a float or None."""
+    if value is None:
+        return None
+    cleaned = re.sub(r"[,\s]", "", str(value))
+    try:
+        number = float(cleaned)
+    except ValueError:
+        # "unknown", "n/a", "none", ranges like "30-165"...
+        return None
+    # float() also takes "nan" and "inf", neither sorts nor compares as a stat
+    return number if math.isfinite(number) else None
+
+def numeric_columns(model):
+    """String field -> its parsed "<field>_num" shadow column."""
+    return {field: getattr(model, field + "_num") for field in getattr(model, "numeric_fields", ())}
+
+def fill_numeric(model, values):
+    # shadow columns for a dict of column values, used by the Core inserts
+    for field in getattr(model, "numeric_fields", ()):
+        if field in values:
+            values[field + "_num"] = parse_number(values[field])
+    return values
+
+def make_serializer():
+    """serialize() for the model class body it is assigned in, from the column metadata.
+
+    The columns are not mapped yet while the class body runs: the keys and
+    the attrgetter are computed on the first call, then a call is a single
+    dict(zip()) instead of a hand-written dict literal per model.
+    """
+    built = {}
+
+    def serialize(self):
+        model = type(self)
+        if model not in built:
+            columns = serialized_columns(model)
+            built[model] = tuple(columns), attrgetter(*(column.key for column in columns.values()))
+        keys, values = built[model]
+        return dict(zip(keys, values(self)))
+    return serialize
+
+class TableVersion(db.Model):
+    # generation counter per table, bumped in the same transaction as every write
+    __tablename__ = 'table_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<TableVersion %r %r>' % (self.name, self.version)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -9,90 +76,87 @@ class User(db.Model):
     password = db.Column(db.String(80), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
     favorites = db.relationship('Favorites', backref='user', lazy=True)
+    serialize_hidden = ('password',)
+    serialize = make_serializer()
 
     def __repr__(self):
         return '<User %r>' % self.user_name
-
-    def serialize(self):
-        return {
-            "id": self.id,
-            "email": self.email,
-            "user_name" : self.user_name,
-            "is_active": self.is_active
-            # do not serialize the password, its a security breach
-        }
     
     def get_favorites(self):
         return list(map(lambda item: item.serialize(), self.favorites))
 
 class Planet(db.Model):
+    __table_args__ = (
+        # GET /favorites/top
+        db.Index('ix_planet_favorites_count_id', 'favorites_count', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, index=True)
     rotation_period = db.Column(db.String(250))
     orbital_period = db.Column(db.String(250))
     diameter = db.Column(db.String(250))
-    climate = db.Column(db.String(250))
+    climate = db.Column(db.String(250), index=True)
     gravity = db.Column(db.String(250))
-    terrain = db.Column(db.String(250))
+    terrain = db.Column(db.String(250), index=True)
     surface_water = db.Column(db.String(250))
     population = db.Column(db.String(250))
+    # parsed copies of the numeric strings, for range queries and sorting
+    rotation_period_num = db.Column(db.Float, index=True)
+    orbital_period_num = db.Column(db.Float, index=True)
+    diameter_num = db.Column(db.Float, index=True)
+    surface_water_num = db.Column(db.Float, index=True)
+    population_num = db.Column(db.Float, index=True)
+    # likes of this planet, maintained by counters.py in the favorites' transaction
+    favorites_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     favorites = db.relationship('Favorites', backref='planet', lazy=True)
+    counter_fields = ('favorites_count',)
+    numeric_fields = ('rotation_period', 'orbital_period', 'diameter', 'surface_water', 'population')
+    serialize = make_serializer()
 
     def __repr__(self):
         return '<Planet %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "rotation_period" : self.rotation_period,
-            "orbital_period": self.orbital_period,
-            "diameter": self.diameter,
-            "climate": self.climate,
-            "gravity": self.gravity,
-            "terrain": self.terrain,
-            "surface_water": self.surface_water,
-            "population": self.population
-        }
-
 class Character(db.Model):
+    __table_args__ = (
+        # GET /favorites/top
+        db.Index('ix_character_favorites_count_id', 'favorites_count', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), unique=True, nullable=False)
     height = db.Column(db.String(250))
     mass = db.Column(db.String(250))
     hair_color = db.Column(db.String(250))
     skin_color = db.Column(db.String(250))
-    eye_color = db.Column(db.String(250))
+    eye_color = db.Column(db.String(250), index=True)
     birth_year = db.Column(db.String(250))
-    gender = db.Column(db.String(250))
+    gender = db.Column(db.String(250), index=True)
     #One to one relationship with Planet
-    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
+    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), index=True)
     planet = db.relationship('Planet', backref='character', lazy=True)
+    # parsed copies of the numeric strings, for range queries and sorting
+    height_num = db.Column(db.Float, index=True)
+    mass_num = db.Column(db.Float, index=True)
     #Agregar relacion 0 to many con vehicles
+    # likes of this character, maintained by counters.py in the favorites' transaction
+    favorites_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     favorites = db.relationship('Favorites', backref='character', lazy=True)
+    counter_fields = ('favorites_count',)
+    serialize_renames = {'planet_id': 'planet'}
+    numeric_fields = ('height', 'mass')
+    serialize = make_serializer()
 
     def __repr__(self):
         return '<Character %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "height": self.height,
-            "mass": self.mass,
-            "hair_color": self.hair_color,
-            "skin_color": self.skin_color,
-            "eye_color": self.eye_color,
-            "birth_year": self.birth_year,
-            "gender": self.gender,
-            "planet": self.planet_id
-        }
-
 class Vehicle(db.Model):
+    __table_args__ = (
+        # GET /favorites/top
+        db.Index('ix_vehicle_favorites_count_id', 'favorites_count', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), unique=True, nullable=False)
-    model = db.Column(db.String(250))
-    manufacturer = db.Column(db.String(250))
+    model = db.Column(db.String(250), index=True)
+    manufacturer = db.Column(db.String(250), index=True)
     cost_in_credits = db.Column(db.String(250))
     length = db.Column(db.String(250))
     max_atmosphering_speed = db.Column(db.String(250))
@@ -100,53 +164,140 @@ class Vehicle(db.Model):
     passengers = db.Column(db.String(250))
     cargo_capacity = db.Column(db.String(250))
     consumables = db.Column(db.String(250))
-    vehicle_class = db.Column(db.String(250))
+    vehicle_class = db.Column(db.String(250), index=True)
+    # parsed copies of the numeric strings, for range queries and sorting
+    cost_in_credits_num = db.Column(db.Float, index=True)
+    length_num = db.Column(db.Float, index=True)
+    max_atmosphering_speed_num = db.Column(db.Float, index=True)
+    crew_num = db.Column(db.Float, index=True)
+    passengers_num = db.Column(db.Float, index=True)
+    cargo_capacity_num = db.Column(db.Float, index=True)
+    # likes of this vehicle, maintained by counters.py in the favorites' transaction
+    favorites_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     favorites = db.relationship('Favorites', backref='vehicle', lazy=True)
+    counter_fields = ('favorites_count',)
+    numeric_fields = ('cost_in_credits', 'length', 'max_atmosphering_speed', 'crew', 'passengers', 'cargo_capacity')
+    serialize = make_serializer()
 
     def __repr__(self):
         return '<Vehicle %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "model": self.model,
-            "manufacturer": self.manufacturer,
-            "cost_in_credits": self.cost_in_credits,
-            "length": self.length,
-            "max_atmosphering_speed": self.max_atmosphering_speed,
-            "crew": self.crew,
-            "passengers": self.passengers,
-            "cargo_capacity": self.cargo_capacity,
-            "consumables": self.consumables,
-            "vehicle_class": self.vehicle_class
-        }
-
 class Favorites(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'))
     planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'))
-    
+
+    # a user can like each planet / character / vehicle only once
+    __table_args__ = (
+        db.Index('ix_favorites_user_id_id', 'user_id', 'id'),
+        db.Index('ix_favorites_planet_id', 'planet_id'),
+        db.Index('ix_favorites_character_id', 'character_id'),
+        db.Index('ix_favorites_vehicle_id', 'vehicle_id'),
+        db.Index('uq_favorites_user_id_planet_id', 'user_id', 'planet_id', unique=True,
+                 postgresql_where=db.text('planet_id IS NOT NULL'), sqlite_where=db.text('planet_id IS NOT NULL')),
+        db.Index('uq_favorites_user_id_character_id', 'user_id', 'character_id', unique=True,
+                 postgresql_where=db.text('character_id IS NOT NULL'), sqlite_where=db.text('character_id IS NOT NULL')),
+        db.Index('uq_favorites_user_id_vehicle_id', 'user_id', 'vehicle_id', unique=True,
+                 postgresql_where=db.text('vehicle_id IS NOT NULL'), sqlite_where=db.text('vehicle_id IS NOT NULL')),
+    )
 
     def __repr__(self):
         return '<Favorites %r>' % self.id
 
     def serialize(self):
-        vehicle = Vehicle.query.filter_by(id=self.vehicle_id).first()
-        character = Character.query.filter_by(id=self.character_id).first()
-        planet = Planet.query.filter_by(id=self.planet_id).first()
-
         data = {
             "id" : self.id,
             "user_id": self.user_id,
-            "character_name": character.serialize()["name"] if character else None,
-            "planet_name": planet.serialize()["name"] if planet else None,
-            "vehicle_name": vehicle.serialize()["name"] if vehicle else None
+            "character_name": self.character.name if self.character_id else None,
+            "planet_name": self.planet.name if self.planet_id else None,
+            "vehicle_name": self.vehicle.name if self.vehicle_id else None
         }
 
         # retona solo las key : values donde no son null
         return {
             key: value for key, value in data.items() if value is not None
-            }
\ No newline at end of file
+            }
+
+    @staticmethod
+    def query_with_names(fields=None):
+        # one query with outer joins instead of three lookups per favorite,
+        # only joining the targets whose name was asked for
+        targets = (
+            ("character_name", Character, Favorites.character_id),
+            ("planet_name", Planet, Favorites.planet_id),
+            ("vehicle_name", Vehicle, Favorites.vehicle_id)
+        )
+        columns = [Favorites.id]
+        if fields is None or "user_id" in fields:
+            columns.append(Favorites.user_id)
+        wanted = [target for target in targets if fields is None or target[0] in fields]
+        columns += [model.name.label(key) for key, model, _ in wanted]
+
+        query = db.session.query(*columns)
+        for _, model, column in wanted:
+            query = query.outerjoin(model, column == model.id)
+        return query
+
+    @staticmethod
+    def serialize_row(row):
+        # same shape as serialize(), built from a query_with_names() row
+        return {
+            key: value for key, value in zip(row._fields, row) if value is not None
+            }
+
+    serialize_fields = ("id", "user_id", "character_name", "planet_name", "vehicle_name")
+
+
+def serialized_columns(model):
+    """Output key -> mapped column for every field model.serialize() returns.
+
+    The counter_fields change with every like, they are left out here (lists,
+    snapshots, exports) and only returned through entity_columns().
+    """
+    renames = getattr(model, "serialize_renames", {})
+    hidden = set(getattr(model, "serialize_hidden", ()))
+    hidden.update(field + "_num" for field in getattr(model, "numeric_fields", ()))
+    hidden.update(getattr(model, "counter_fields", ()))
+    return {
+        renames.get(column.key, column.key): getattr(model, column.key)
+        for column in model.__table__.columns
+        if column.key not in hidden
+    }
+
+
+def entity_columns(model):
+    """serialized_columns() plus the counter_fields, for the single entity routes."""
+    columns = serialized_columns(model)
+    columns.update((field, getattr(model, field)) for field in getattr(model, "counter_fields", ()))
+    return columns
+
+
+def counter_version(model, field):
+    # table_version row of a counter, bumped without touching the table's own
+    return "%s.%s" % (model.__table__.name, field)
+
+
+def entity_versions(model):
+    """table_version names an entity_columns() payload depends on."""
+    return (model.__table__.name,) + tuple(
+        counter_version(model, field) for field in getattr(model, "counter_fields", ())
+    )
+
+
+def sync_numeric(mapper, connection, target):
+    for field in target.numeric_fields:
+        setattr(target, field + "_num", parse_number(getattr(target, field)))
+
+for numeric_model in (Planet, Character, Vehicle):
+    event.listen(numeric_model, "before_insert", sync_numeric)
+    event.listen(numeric_model, "before_update", sync_numeric)
+
+
+# favorite "type" -> target model, the Favorites column is "<type>_id"
+FAVORITE_TARGETS = {
+    "planet": Planet,
+    "character": Character,
+    "vehicle": Vehicle
+}
@@ -0,0 +1,116 @@
+"""
+Per-request SQL statistics built on SQLAlchemy cursor events.
+
+- counts statements and DB time per request, optionally reported in the
+  X-DB-Queries / X-DB-Time response headers (SQL_STATS_HEADERS)
+- logs statements slower than SLOW_QUERY_MS with their parameters, and the
+  EXPLAIN plan when SLOW_QUERY_EXPLAIN is set
+- enforces a per-request SQL_QUERY_BUDGET, raising QueryBudgetExceeded when
+  the app is under test, and query_budget() for ad-hoc budgets in tests
+"""
+import logging
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, current_app, request
+from sqlalchemy import event
+
+logger = logging.getLogger("sql.slow")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class _Budget:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.statements = []
+
+
+_budgets = []
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._stats_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    if conn.info.get("explaining"):
+        return
+    elapsed = time.perf_counter() - getattr(context, "_stats_started", time.perf_counter())
+
+    for budget in _budgets:
+        budget.count += 1
+        budget.statements.append(statement)
+
+    if not has_request_context():
+        return
+    g.db_queries = g.get("db_queries", 0) + 1
+    g.db_time = g.get("db_time", 0.0) + elapsed
+
+    threshold = current_app.config.get("SLOW_QUERY_MS")
+    if threshold and elapsed * 1000 >= threshold:
+        _log_slow(conn, statement, parameters, elapsed, executemany)
+
+
+def _log_slow(conn, statement, parameters, elapsed, executemany):
+    logger.warning("slow query (%.1f ms): %s; parameters=%r", elapsed * 1000, statement, parameters)
+    if executemany or not current_app.config.get("SLOW_QUERY_EXPLAIN"):
+        return
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    conn.info["explaining"] = True
+    try:
+        plan = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        logger.warning("plan:\n%s", "\n".join(" | ".join(str(value) for value in row) for row in plan))
+    except Exception:
+        logger.exception("could not EXPLAIN slow query")
+    finally:
+        conn.info["explaining"] = False
+
+
+def _report(response):
+    queries = g.get("db_queries", 0)
+    if current_app.config.get("SQL_STATS_HEADERS"):
+        response.headers["X-DB-Queries"] = str(queries)
+        response.headers["X-DB-Time"] = "%.3f" % (g.get("db_time", 0.0) * 1000)
+
+    budget = current_app.config.get("SQL_QUERY_BUDGET")
+    if budget and queries > budget:
+        message = "%s %s ran %d queries (budget %d)" % (request.method, request.path, queries, budget)
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+
+@contextmanager
+def query_budget(limit):
+    """Fail with QueryBudgetExceeded if the block runs more than limit statements.
+
+        with query_budget(2):
+            client.get("/user/1/favorites")
+    """
+    budget = _Budget(limit)
+    _budgets.append(budget)
+    try:
+        yield budget
+    finally:
+        _budgets.remove(budget)
+    if budget.count > limit:
+        raise QueryBudgetExceeded(
+            "%d queries (budget %d):\n%s" % (budget.count, limit, "\n".join(budget.statements))
+        )
+
+
+def watch_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def setup_query_stats(app, engine):
+    watch_engine(engine)
+    app.after_request(_report)
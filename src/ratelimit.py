@@ -0,0 +1,153 @@
+"""
+Per-client token bucket rate limiting shared by every gunicorn worker.
+
+Buckets live in a memory-mapped file (RATE_LIMIT_FILE) of RATE_LIMIT_SLOTS
+fixed slots, each holding a key fingerprint, the tokens left and the time
+of the last refill. A key takes the first free one of PROBES slots from its
+hash; when they are all taken it shares the idlest bucket rather than
+starting over with a full one. A bucket is keyed by client IP and route;
+the ids in the URLs are not authenticated, a client walking /user/<id>
+must not get a fresh bucket per id. Behind proxies, RATE_LIMIT_TRUST_PROXY
+is the number of them: the client is that many entries from the end of
+X-Forwarded-For, the entries before were sent by the client itself. A flock
+plus a thread lock guard the read-modify-write, about a couple of
+microseconds per request.
+
+Limits are "rate,burst" (requests per second, bucket size):
+RATE_LIMIT_DEFAULT applies to every route, RATE_LIMITS overrides it per
+url rule, e.g. "/planets=5,20;/characters=5,20". Requests over the limit
+get a 429 with Retry-After.
+"""
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from flask import request, jsonify, current_app
+
+SLOT = struct.Struct("<Qdd")
+# slots tried after the one a key hashes to
+PROBES = 4
+
+
+def parse_limit(text):
+    rate, burst = (float(value) for value in text.split(","))
+    return rate, burst
+
+
+def parse_proxies(text):
+    """RATE_LIMIT_TRUST_PROXY: a number of proxies, "true" for one, "" for none."""
+    text = text.strip().lower()
+    if text in ("", "0", "false", "no"):
+        return 0
+    if text in ("true", "yes"):
+        return 1
+    return int(text)
+
+
+def parse_limits(text):
+    """"/planets=5,20;/characters=5,20" -> {"/planets": (5.0, 20.0), ...}"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in text.split(";"))):
+        rule, _, limit = entry.partition("=")
+        limits[rule.strip()] = parse_limit(limit)
+    return limits
+
+
+class TokenBuckets:
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._fd = None
+        self._open()
+
+    def _open(self):
+        if self._fd is not None:
+            self._map.close()
+            os.close(self._fd)
+        # flock() locks belong to the open file, each process needs its own
+        self._pid = os.getpid()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self.slots * SLOT.size:
+            os.ftruncate(self._fd, self.slots * SLOT.size)
+        self._map = mmap.mmap(self._fd, self.slots * SLOT.size)
+
+    def _find(self, digest, burst, now):
+        """Offset, tokens and last refill of the bucket of digest."""
+        idlest = None
+        for probe in range(PROBES):
+            offset = ((digest + probe) % self.slots) * SLOT.size
+            fingerprint, tokens, updated = SLOT.unpack_from(self._map, offset)
+            if fingerprint == digest:
+                return offset, tokens, updated
+            if fingerprint == 0:
+                # slots are never emptied, the key is not further along
+                return offset, burst, now
+            if idlest is None or updated < idlest[2]:
+                idlest = (offset, tokens, updated)
+        # every probed slot is taken: the key shares the idlest bucket, with
+        # its tokens, a collision must never hand out a full bucket
+        return idlest
+
+    def take(self, key, rate, burst, now=None):
+        """Take one token from the bucket of key, return the seconds to wait (0 when allowed)."""
+        # 0 marks an empty slot
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        now = time.time() if now is None else now
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked after setup_rate_limit(), gunicorn's preload_app
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, tokens, updated = self._find(digest, burst, now)
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                wait = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / rate
+                SLOT.pack_into(self._map, offset, digest, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return wait
+
+
+buckets = None
+
+
+def client_key():
+    proxies = current_app.config["RATE_LIMIT_TRUST_PROXY"]
+    forwarded = request.headers.getlist("X-Forwarded-For")
+    route = [address.strip() for header in forwarded for address in header.split(",")]
+    if proxies and len(route) >= proxies:
+        # each trusted proxy appends the address it got the request from
+        return "ip:%s" % route[-proxies]
+    return "ip:%s" % request.remote_addr
+
+
+def _limit():
+    config = current_app.config
+    if not config["RATE_LIMIT_ENABLED"]:
+        return None
+    rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    rate, burst = config["RATE_LIMITS"].get(rule, config["RATE_LIMIT_DEFAULT"])
+    wait = buckets.take("%s|%s" % (client_key(), rule), rate, burst)
+    if not wait:
+        return None
+    response = jsonify({"msg": "Too many requests"})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+def setup_rate_limit(app):
+    global buckets
+    buckets = TokenBuckets(app.config["RATE_LIMIT_FILE"], app.config["RATE_LIMIT_SLOTS"])
+    app.before_request(_limit)
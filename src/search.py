@@ -0,0 +1,132 @@
+"""
+Ranked full-text search over planets, characters and vehicles.
+
+The indexes are created by the migrations, and by db.create_all() through
+the DDL events below: a generated tsvector column with a GIN index on
+Postgres, FTS5 external-content tables on SQLite. Other databases (MySQL)
+fall back to unindexed LIKE matching, ranked by the number of matching
+columns.
+"""
+import re
+from sqlalchemy import text, event, DDL, select, literal, and_, or_, case
+from models import db
+
+# searchable columns per table, the migrations index the same ones
+SEARCHABLE = {
+    "planet": ("name", "climate", "terrain"),
+    "character": ("name", "gender", "hair_color", "skin_color", "eye_color"),
+    "vehicle": ("name", "model", "manufacturer", "vehicle_class"),
+}
+
+
+def _sqlite_ddl(table, columns):
+    listed = ", ".join(columns)
+    new_values = ", ".join("new.%s" % column for column in columns)
+    old_values = ", ".join("old.%s" % column for column in columns)
+    names = {'t': table, 'c': listed, 'new': new_values, 'old': old_values}
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS %(t)s_fts USING fts5(%(c)s, content='%(t)s', content_rowid='id')" % names,
+        # external content table: triggers keep the index in step with the rows
+        "CREATE TRIGGER IF NOT EXISTS %(t)s_fts_insert AFTER INSERT ON %(t)s BEGIN "
+        "INSERT INTO %(t)s_fts(rowid, %(c)s) VALUES (new.id, %(new)s); END" % names,
+        "CREATE TRIGGER IF NOT EXISTS %(t)s_fts_delete AFTER DELETE ON %(t)s BEGIN "
+        "INSERT INTO %(t)s_fts(%(t)s_fts, rowid, %(c)s) VALUES ('delete', old.id, %(old)s); END" % names,
+        "CREATE TRIGGER IF NOT EXISTS %(t)s_fts_update AFTER UPDATE ON %(t)s BEGIN "
+        "INSERT INTO %(t)s_fts(%(t)s_fts, rowid, %(c)s) VALUES ('delete', old.id, %(old)s); "
+        "INSERT INTO %(t)s_fts(rowid, %(c)s) VALUES (new.id, %(new)s); END" % names,
+        "INSERT INTO %(t)s_fts(%(t)s_fts) VALUES ('rebuild')" % names,
+    ]
+
+
+def _postgresql_ddl(table, columns):
+    document = " || ' ' || ".join("coalesce(%s, '')" % column for column in columns)
+    return [
+        "ALTER TABLE %s ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', %s)) STORED" % (table, document),
+        "CREATE INDEX ix_%s_search_vector ON %s USING gin (search_vector)" % (table, table),
+    ]
+
+
+def _listen_ddl():
+    # the same objects as the f9731c0cb4a0 migration, for databases made by create_all()
+    for table, columns in SEARCHABLE.items():
+        target = db.metadata.tables[table]
+        for statement in _sqlite_ddl(table, columns):
+            event.listen(target, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+        for statement in _postgresql_ddl(table, columns):
+            event.listen(target, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+        # the virtual table is not dropped with its content table
+        event.listen(target, "before_drop", DDL("DROP TABLE IF EXISTS %s_fts" % table).execute_if(dialect="sqlite"))
+
+_listen_ddl()
+
+
+def _fts5_query(q):
+    # quote every word so user input can't use FTS5 operators, last word as prefix
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    quoted = ['"%s"' % word for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _sqlite_statement(types):
+    parts = [
+        "SELECT '%s' AS type, rowid AS id, name, bm25(%s_fts) AS rank "
+        "FROM %s_fts WHERE %s_fts MATCH :q" % (table, table, table, table)
+        for table in types
+    ]
+    # bm25() is lower for better matches
+    return " UNION ALL ".join(parts) + " ORDER BY rank, type, id LIMIT :limit OFFSET :offset"
+
+
+def _postgresql_statement(types):
+    parts = [
+        "SELECT '%s' AS type, id, name, ts_rank(search_vector, query) AS rank "
+        "FROM %s, websearch_to_tsquery('simple', :q) AS query "
+        "WHERE search_vector @@ query" % (table, table)
+        for table in types
+    ]
+    return " UNION ALL ".join(parts) + " ORDER BY rank DESC, type, id LIMIT :limit OFFSET :offset"
+
+
+def _like_statement(words, types, limit, offset):
+    parts = []
+    for kind in types:
+        table = db.metadata.tables[kind]
+        columns = [table.c[name] for name in SEARCHABLE[kind]]
+        # every word in one of the columns, ranked by the columns matching a word
+        matches = [or_(*(column.icontains(word, autoescape=True) for word in words)) for column in columns]
+        rank = sum(case((match, 1), else_=0) for match in matches)
+        parts.append(
+            select(literal(kind).label("type"), table.c.id, table.c.name, rank.label("rank"))
+            .where(and_(*(or_(*(column.icontains(word, autoescape=True) for column in columns)) for word in words)))
+        )
+    matched = (parts[0].union_all(*parts[1:]) if len(parts) > 1 else parts[0]).subquery()
+    return (
+        select(matched)
+        .order_by(matched.c.rank.desc(), matched.c.type, matched.c.id)
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+def search(session, q, types, limit, offset):
+    """Return up to limit {"type", "id", "name", "rank"} matches, best first."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        q = _fts5_query(q)
+        if q is None:
+            return []
+        statement = _sqlite_statement(types)
+    elif dialect == "postgresql":
+        statement = _postgresql_statement(types)
+    else:
+        words = re.findall(r"\w+", q)
+        if not words:
+            return []
+        return [dict(row._mapping) for row in session.execute(_like_statement(words, types, limit, offset))]
+
+    rows = session.execute(text(statement), {"q": q, "limit": limit, "offset": offset})
+    return [dict(row._mapping) for row in rows]
@@ -0,0 +1,290 @@
+"""
+In-memory snapshot of the catalog tables (planets, characters, vehicles).
+
+Every worker keeps each row pre-serialized as JSON bytes. The full body of
+the first page and of ?all=true is rendered, and compressed for an
+encoding, on the first request that needs it and then kept with the
+snapshot. Plain list requests (no filters, sort, fields nor streaming) are
+answered from it without any SQL and without serializing.
+
+Writes committed by this process (API routes, bulk inserts, the admin)
+mark the touched ids; the next request re-reads only those rows and keeps
+the first page when they all come after it. Writes from other workers are
+noticed by comparing the table_version counter, at most every
+SNAPSHOT_CHECK_INTERVAL seconds, and rebuild the snapshot in a background
+thread; until it is done the requests are answered by the view. The
+version served is sent in the X-Catalog-Version header.
+"""
+import threading
+import time
+from bisect import bisect_right
+from functools import wraps
+from flask import request, current_app
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, listen_once, serialized_columns
+from etags import get_versions, compute_etag
+from compress import negotiate, compress
+from utils import wants_all, wants_ndjson, page_size, encode_cursor, decode_cursor
+
+SERVED_ARGS = {"all", "limit", "after"}
+
+
+class _State:
+    # rows and ids are never changed once built, a new state is swapped in as
+    # a whole; bodies and compressed only ever gain entries, so readers never
+    # need the lock (two requests may render the same body, both are equal)
+
+    def __init__(self, version, rows, ids):
+        self.version = version
+        self.rows = rows
+        self.ids = ids
+        self.bodies = {}
+        self.compressed = {}
+
+
+class CatalogSnapshot:
+
+    def __init__(self, model, msg):
+        self.model = model
+        self.msg = msg
+        self.table = model.__table__.name
+        columns = serialized_columns(model)
+        self.keys = tuple(columns)
+        self.columns = list(columns.values())
+        self.state = None
+        self.checked = 0.0
+        self.pending_ids = set()
+        self.pending_bumps = 0
+        self.rebuilding = False
+        self.lock = threading.Lock()
+
+    def _encode(self, row):
+        return current_app.json.dumps(dict(zip(self.keys, row))).encode()
+
+    def _fetch(self, ids=None):
+        statement = select(*self.columns).order_by(self.model.id)
+        if ids is not None:
+            statement = statement.where(self.model.id.in_(ids))
+        return {row.id: self._encode(row) for row in db.session.execute(statement)}
+
+    def _render(self, state, start, limit):
+        page = state.ids[start:] if limit is None else state.ids[start:start + limit]
+        more = limit is not None and start + limit < len(state.ids)
+        rows = state.rows
+        # same keys, in the same sorted order, as the jsonify() body of the route
+        return b"".join((
+            b'{"msg":', current_app.json.dumps(self.msg).encode(),
+            b',"next":', current_app.json.dumps(encode_cursor([page[-1]]) if more else None).encode(),
+            b',"results":[', b",".join(rows[id] for id in page), b"]}\n"
+        ))
+
+    def body(self, state, key, encoding):
+        """(body, Content-Encoding) of "all" or "first", rendered and compressed on first use."""
+        config = current_app.config
+        body = state.bodies.get(key)
+        if body is None:
+            limit = None if key == "all" else config["DEFAULT_PAGE_SIZE"]
+            body = state.bodies[key] = self._render(state, 0, limit)
+        if encoding is None or len(body) < config["COMPRESS_MIN_SIZE"]:
+            return body, None
+        compressed = state.compressed.get((key, encoding))
+        if compressed is None:
+            compressed = state.compressed[key, encoding] = compress(body, encoding, config)
+        return compressed, encoding
+
+    def build(self):
+        version = get_versions(db.session, [self.table])[0]
+        rows = self._fetch()
+        self.state = _State(version, rows, sorted(rows))
+        self.pending_ids.clear()
+        self.pending_bumps = 0
+        self.checked = time.monotonic()
+
+    def current(self):
+        """The up to date state, patched first when needed, None while it is (re)built."""
+        with self.lock:
+            if self.rebuilding:
+                return None
+            if self.state is None:
+                self._rebuild()
+                return None
+            if self.pending_ids or time.monotonic() - self.checked >= current_app.config["SNAPSHOT_CHECK_INTERVAL"]:
+                self._refresh()
+            return None if self.rebuilding else self.state
+
+    def _refresh(self):
+        state = self.state
+        version = get_versions(db.session, [self.table])[0]
+        if version == state.version + self.pending_bumps and self.pending_bumps:
+            # only our own commits since the last build: re-read those rows
+            self.state = self._patch(state, version, self._fetch(self.pending_ids))
+        elif version != state.version:
+            self._rebuild()
+            return
+        self.pending_ids.clear()
+        self.pending_bumps = 0
+        self.checked = time.monotonic()
+
+    def _patch(self, state, version, changed):
+        rows = dict(state.rows)
+        for id in self.pending_ids:
+            if id in changed:
+                rows[id] = changed[id]
+            else:
+                rows.pop(id, None)
+        same_ids = len(rows) == len(state.rows) and all(id in state.rows for id in self.pending_ids)
+        patched = _State(version, rows, state.ids if same_ids else sorted(rows))
+
+        size = current_app.config["DEFAULT_PAGE_SIZE"]
+        if ("first" in state.bodies and len(state.ids) > size and len(patched.ids) > size
+                and all(id > state.ids[size - 1] for id in self.pending_ids)):
+            # every change is past the first page, its body is unchanged
+            patched.bodies["first"] = state.bodies["first"]
+            patched.compressed.update(
+                (key, body) for key, body in state.compressed.items() if key[0] == "first"
+            )
+        return patched
+
+    def _rebuild(self):
+        """Rebuild in a background thread, the requests go to the view meanwhile."""
+        self.rebuilding = True
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                try:
+                    version = get_versions(db.session, [self.table])[0]
+                    rows = self._fetch()
+                    state = _State(version, rows, sorted(rows))
+                except SQLAlchemyError as error:
+                    app.logger.warning("catalog snapshot of %s not rebuilt: %s", self.table, error.__class__.__name__)
+                    state = None
+                finally:
+                    db.session.remove()
+                with self.lock:
+                    if self.pending_bumps:
+                        # our commits during the rebuild may or may not be in
+                        # it, the version can not tell: build again
+                        state = None
+                    self.state = state
+                    self.pending_ids.clear()
+                    self.pending_bumps = 0
+                    self.checked = time.monotonic()
+                    self.rebuilding = False
+
+        # the commits marked so far are in what the rebuild reads
+        self.pending_ids.clear()
+        self.pending_bumps = 0
+        threading.Thread(target=run, name="snapshot-%s" % self.table, daemon=True).start()
+
+    def mark(self, ids, bumps):
+        with self.lock:
+            self.pending_ids.update(ids)
+            self.pending_bumps += bumps
+
+
+snapshots = {}
+
+
+def mark_written(session, model, ids):
+    """Record a Core write (one table_version bump) the flush hooks do not see."""
+    if model.__table__.name in snapshots:
+        written = session.info.setdefault("snapshot_writes", {})
+        table_ids, bumps = written.get(model.__table__.name, (set(), 0))
+        written[model.__table__.name] = (table_ids | set(ids), bumps + 1)
+
+
+def _collect_written(session, flush_context):
+    # the same objects etags._bump_written bumps a version for
+    dirty = [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    touched = {}
+    for obj in list(session.new) + dirty + list(session.deleted):
+        if obj.__table__.name in snapshots:
+            touched.setdefault(obj.__table__.name, set()).add(obj.id)
+    written = session.info.setdefault("snapshot_writes", {})
+    for table, ids in touched.items():
+        table_ids, bumps = written.get(table, (set(), 0))
+        written[table] = (table_ids | ids, bumps + 1)
+
+
+def _apply_written(session):
+    for table, (ids, bumps) in session.info.pop("snapshot_writes", {}).items():
+        snapshots[table].mark(ids, bumps)
+
+
+def _forget_written(session):
+    session.info.pop("snapshot_writes", None)
+
+
+def servable():
+    # plain list requests only, everything else goes to the view
+    return set(request.args) <= SERVED_ARGS and not wants_ndjson()
+
+
+def from_snapshot(model, msg):
+    """Serve the plain list requests of a @conditional list view from the snapshot.
+
+    msg is the "msg" of the view's response body, the snapshot bodies repeat it.
+    """
+    snapshot = snapshots[model.__table__.name] = CatalogSnapshot(model, msg)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config["SNAPSHOT_ENABLED"] or not servable():
+                return view(*args, **kwargs)
+            state = snapshot.current()
+            if state is None:
+                # being built, the view answers from the database meanwhile
+                return view(*args, **kwargs)
+
+            if wants_all():
+                key, start, limit = "all", 0, None
+            else:
+                limit = page_size()
+                after = request.args.get("after")
+                start = bisect_right(state.ids, decode_cursor(after, 1)[0]) if after else 0
+                key = "first" if start == 0 and limit == current_app.config["DEFAULT_PAGE_SIZE"] else None
+            if start >= len(state.ids):
+                # empty table or past the last page: the view answers the 404
+                return view(*args, **kwargs)
+
+            etag = compute_etag([snapshot.table], [state.version])
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                if key:
+                    body, encoding = snapshot.body(state, key, negotiate())
+                else:
+                    body, encoding = snapshot._render(state, start, limit), None
+                response = current_app.response_class(body, mimetype="application/json")
+                if encoding:
+                    response.headers["Content-Encoding"] = encoding
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = current_app.config["CACHE_CONTROL"]
+            response.headers["X-Catalog-Version"] = str(state.version)
+            return response
+        return wrapper
+    return decorator
+
+
+def build_snapshots(app):
+    """Build every snapshot up front, a missing table (not migrated yet) defers it to the first request."""
+    if not app.config["SNAPSHOT_ENABLED"]:
+        return
+    with app.app_context():
+        try:
+            for snapshot in snapshots.values():
+                with snapshot.lock:
+                    snapshot.build()
+        except SQLAlchemyError as error:
+            app.logger.warning("catalog snapshot not built at startup: %s", error.__class__.__name__)
+        finally:
+            db.session.remove()
+
+
+def setup_snapshots(app, session):
+    listen_once(session, "after_flush", _collect_written)
+    listen_once(session, "after_commit", _apply_written)
+    listen_once(session, "after_rollback", _forget_written)
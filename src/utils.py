@@ -1,4 +1,10 @@
-from flask import jsonify, url_for
+import base64
+import binascii
+import json
+import math
+from flask import jsonify, url_for, request, current_app, Response, stream_with_context
+from sqlalchemy import select, union_all, Boolean, Float, Integer, String
+from models import db, serialized_columns
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +21,215 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def _matches_type(column, value):
+    # a JSON decoded cursor value against the column it is compared with
+    if value is None:
+        return True
+    if isinstance(column.type, Boolean):
+        return isinstance(value, bool)
+    if isinstance(value, bool):
+        return False
+    if isinstance(column.type, Integer):
+        return isinstance(value, int)
+    if isinstance(column.type, Float):
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    if isinstance(column.type, String):
+        return isinstance(value, str)
+    return False
+
+def decode_cursor(cursor, size, column=None):
+    """The values of an encode_cursor() cursor: size of them, the last one an
+    id, the first one a value of column when given (the ?sort= column)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise APIException("Invalid cursor", status_code=400)
+    if (not isinstance(values, list) or len(values) != size
+            or isinstance(values[-1], bool) or not isinstance(values[-1], int)):
+        raise APIException("Invalid cursor", status_code=400)
+    if column is not None and not _matches_type(column, values[0]):
+        raise APIException("Invalid cursor", status_code=400)
+    return values
+
+def wants_all():
+    return request.args.get("all", "").lower() in ("1", "true", "yes")
+
+def page_size():
+    default = current_app.config["DEFAULT_PAGE_SIZE"]
+    maximum = current_app.config["MAX_PAGE_SIZE"]
+    try:
+        limit = int(request.args.get("limit", default))
+    except ValueError:
+        raise APIException("limit must be an integer", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    return min(limit, maximum)
+
+def order_by(query, model, sort=None):
+    """Order by the ?sort= column (nulls last) with the id as tie breaker."""
+    if sort is None:
+        return query.order_by(model.id)
+    _, column, descending = sort
+    if column is model.id:
+        return query.order_by(model.id.desc() if descending else model.id)
+    ordering = column.desc() if descending else column.asc()
+    return query.order_by(ordering.nulls_last(), model.id)
+
+def seek(query, model, sort, cursor, size):
+    """Ordered query of the rows that come after the cursor in order_by() order,
+    at most size of them."""
+    if sort is None:
+        (last_id,) = cursor
+        return order_by(query.filter(model.id > last_id), model).limit(size)
+    _, column, descending = sort
+    value, last_id = cursor
+    if column is model.id:
+        return order_by(query.filter(model.id < last_id if descending else model.id > last_id), model, sort).limit(size)
+    if value is None:
+        # already in the trailing NULL segment
+        return query.filter(column.is_(None), model.id > last_id).order_by(model.id).limit(size)
+    # the ties of the cursor, the values after it, then the NULL segment: each
+    # part is one index range, an OR of them (and "OR column IS NULL") would
+    # scan the index from its start
+    parts = (
+        query.filter(column == value, model.id > last_id).order_by(model.id),
+        query.filter(column < value if descending else column > value)
+        .order_by(column.desc() if descending else column.asc(), model.id),
+        query.filter(column.is_(None)).order_by(model.id),
+    )
+    rows = union_all(*(select(part.limit(size).subquery()) for part in parts)).subquery()
+    ordering = rows.c[column.key].desc() if descending else rows.c[column.key].asc()
+    return db.session.query(*rows.c).order_by(ordering.nulls_last(), rows.c.id).limit(size)
+
+def page_query(query, model, sort=None):
+    """Ordered and seeked query for ?limit= / ?after= / ?all=, and the page size
+    (None for ?all=true). The query is run with one extra row, see next_page()."""
+    if wants_all():
+        return order_by(query, model, sort), None
+
+    limit = page_size()
+    after = request.args.get("after")
+    # fetch one extra row to know whether there is a next page
+    if after:
+        cursor = decode_cursor(after, 1) if sort is None else decode_cursor(after, 2, sort[1])
+        return seek(query, model, sort, cursor, limit + 1), limit
+    return order_by(query, model, sort).limit(limit + 1), limit
+
+def next_page(items, limit, sort=None):
+    """Trim the extra row of a page_query() result and build the next cursor."""
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    last = items[-1]
+    if sort is None:
+        return items, encode_cursor([last.id])
+    return items, encode_cursor([getattr(last, sort[1].key), last.id])
+
+def paginate(query, model, sort=None):
+    """Seek pagination driven by ?limit= and ?after=, in ?sort= order.
+
+    Returns the page items and the cursor for the next page (None on the
+    last page). ?all=true keeps the old unpaginated behavior.
+    """
+    query, limit = page_query(query, model, sort)
+    return next_page(query.all(), limit, sort)
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+def wants_ndjson():
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+def wants_stream():
+    return wants_ndjson() or request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+def stream_list(query, model, msg, serialize, sort=None):
+    """Stream the whole table without building the list or the JSON string in memory.
+
+    Rows are fetched in chunks of STREAM_CHUNK_SIZE (server-side cursor on
+    Postgres) and written as NDJSON when the client asks for it, otherwise
+    as the same {"msg", "results", "next"} body the paginated route returns.
+    """
+    chunk_size = current_app.config["STREAM_CHUNK_SIZE"]
+    dumps = current_app.json.dumps
+    ndjson = wants_ndjson()
+    rows = order_by(query, model, sort).yield_per(chunk_size)
+
+    def encode(chunk, first):
+        if ndjson:
+            return "\n".join(chunk) + "\n"
+        return ("" if first else ",") + ",".join(chunk)
+
+    def generate():
+        if not ndjson:
+            yield '{"msg": %s, "results": [' % dumps(msg)
+        chunk = []
+        first = True
+        for item in rows:
+            chunk.append(dumps(serialize(item)))
+            if len(chunk) == chunk_size:
+                yield encode(chunk, first)
+                first = False
+                chunk = []
+        if chunk:
+            yield encode(chunk, first)
+        if not ndjson:
+            yield '], "next": null}'
+
+    mimetype = NDJSON_MIMETYPE if ndjson else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+def requested_fields(allowed):
+    """Parse ?fields=a,b against the allowed field names, None when absent."""
+    raw = request.args.get("fields")
+    if raw is None:
+        return None
+    fields = [name.strip() for name in raw.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise APIException(
+            "Unknown fields: %s" % ", ".join(unknown) if unknown else "fields can not be empty",
+            status_code=400,
+            payload={"allowed": list(allowed)}
+        )
+    # the id is always returned, pagination cursors are built from it
+    return ["id"] + [name for name in fields if name != "id"]
+
+def select_fields(model, sort=None):
+    """Return (query, serialize) for a list route honoring ?fields=.
+
+    Only the serialized columns (or the ?fields= ones) are selected and rows
+    are turned into dicts directly, so the other columns are never fetched
+    and no ORM instance is hydrated. The dicts match model.serialize().
+    """
+    columns = serialized_columns(model)
+    fields = requested_fields(columns) or list(columns)
+
+    selected = [columns[name] for name in fields]
+    if sort is not None and not any(column is sort[1] for column in selected):
+        # the cursor needs the sort value, zip() leaves it out of the output
+        selected.append(sort[1])
+    query = db.session.query(*selected)
+    keys = tuple(fields)
+    return query, lambda row: dict(zip(keys, row))
+
+def project(serialized, fields):
+    """Keep only the requested_fields() of an already serialized dict."""
+    if fields is None:
+        return serialized
+    return {name: serialized[name] for name in fields if name in serialized}
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    # the lazy admin is mounted outside the url map
+    links = ['/admin/'] if app.config.get("ADMIN_MODE", "eager") != "off" else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -1,7 +1,11 @@
 # This file was created to run the application on heroku using gunicorn.
 # Read more about it here: https://devcenter.heroku.com/articles/python-gunicorn
 
-from app import app as application
+import os
+from app import create_app
+
+# gunicorn serves the lean production profile unless APP_PROFILE says otherwise
+application = app = create_app(os.getenv("APP_PROFILE", "production"))
 
 if __name__ == "__main__":
     application.run()
@@ -0,0 +1,43 @@
+import os
+import sys
+import threading
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///" + str(tmp_path / "test.db"))
+    monkeypatch.setenv("ADMIN_MODE", "off")
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "false")
+    monkeypatch.setenv("RATE_LIMIT_FILE", str(tmp_path / "ratelimit"))
+    from app import create_app
+    from models import db
+    from snapshot import snapshots
+
+    app = create_app("production")
+    app.config['TESTING'] = True
+    for snapshot in snapshots.values():
+        # module level, they would still hold the previous test's rows
+        snapshot.state = None
+    with app.app_context():
+        db.create_all()
+        yield app
+        wait_for_snapshots()
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+def wait_for_snapshots():
+    for thread in threading.enumerate():
+        if thread.name.startswith("snapshot-"):
+            thread.join()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
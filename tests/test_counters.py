@@ -0,0 +1,49 @@
+from sqlalchemy import insert
+
+from models import db, User, Planet, Favorites
+
+
+def seed(app):
+    db.session.execute(insert(Planet), [{"name": "Planet %d" % i, "climate": "arid"} for i in range(3)])
+    db.session.execute(insert(User), [
+        {"email": "user%d@example.com" % i, "user_name": "user%d" % i, "password": "secret", "is_active": True}
+        for i in range(2)
+    ])
+    db.session.commit()
+
+
+def like(client, user_id, planet_id):
+    response = client.post("/favorite/planet/%d" % planet_id, json={"user_id": user_id})
+    assert response.status_code == 201, response.get_json()
+
+
+def test_like_keeps_list_etag(app, client):
+    seed(app)
+    planets = client.get("/planets")
+    assert "favorites_count" not in planets.get_json()["results"][0]
+    planet = client.get("/planet/2")
+    assert planet.get_json()["result"]["favorites_count"] == 0
+
+    like(client, 1, 2)
+
+    assert client.get("/planets", headers={"If-None-Match": planets.headers["ETag"]}).status_code == 304
+    again = client.get("/planet/2", headers={"If-None-Match": planet.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.get_json()["result"]["favorites_count"] == 1
+
+
+def test_top_favorites(app, client):
+    seed(app)
+    assert client.get("/favorites/top?type=planet").status_code == 404
+    like(client, 1, 3)
+    like(client, 2, 3)
+    like(client, 1, 1)
+
+    top = client.get("/favorites/top?type=planet")
+    assert [(row["id"], row["favorites_count"]) for row in top.get_json()["results"]] == [(3, 2), (1, 1)]
+
+    favorite_id = db.session.scalars(db.select(Favorites.id).filter_by(user_id=1, planet_id=3)).one()
+    response = client.delete("/favorite/%d/1" % favorite_id)
+    assert response.status_code == 200
+    assert client.get("/favorites/top?type=planet", headers={"If-None-Match": top.headers["ETag"]}).status_code == 200
+    assert client.get("/planet/3").get_json()["result"]["favorites_count"] == 1
@@ -0,0 +1,108 @@
+import io
+import json
+
+from importer import iter_records, ImportState
+from models import db, Planet, Character
+
+
+def write(tmp_path, name, records, ndjson=False):
+    path = tmp_path / name
+    if ndjson:
+        path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    else:
+        path.write_text(json.dumps(records))
+    return str(path)
+
+
+def import_swapi(app, tmp_path, *args):
+    result = app.test_cli_runner().invoke(args=[
+        "import-swapi", "--state-file", str(tmp_path / "state.json"), "--restart", *args
+    ])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_iter_records_formats():
+    records = [{"name": "Tatooine"}, {"name": "Alderaan"}]
+    assert list(iter_records(io.StringIO(json.dumps(records)))) == records
+    assert list(iter_records(io.StringIO(json.dumps({"count": 2, "results": records})))) == records
+    assert list(iter_records(io.StringIO("\n".join(json.dumps(record) for record in records)))) == records
+
+
+def test_import_planets_and_homeworlds(app, tmp_path):
+    planets = write(tmp_path, "planets.json", [
+        {"name": "Tatooine", "climate": "arid", "diameter": "10465", "url": "https://swapi.dev/api/planets/1/"},
+        {"name": "Alderaan", "climate": "temperate", "diameter": "12500"},
+    ])
+    people = write(tmp_path, "people.ndjson", [
+        {"name": "Luke Skywalker", "homeworld": "https://swapi.dev/api/planets/1/"},
+        {"name": "Leia Organa", "homeworld": "Alderaan"},
+        {"name": "Nobody", "homeworld": "https://swapi.dev/api/planets/99/"},
+    ], ndjson=True)
+    output = import_swapi(app, tmp_path, "--planets", planets, "--characters", people)
+
+    assert "1 unresolved homeworlds" in output
+    tatooine = db.session.scalars(db.select(Planet).filter_by(name="Tatooine")).one()
+    assert tatooine.diameter == "10465"
+    assert tatooine.diameter_num == 10465
+    homeworlds = dict(db.session.execute(db.select(Character.name, Character.planet_id)).all())
+    alderaan = db.session.scalars(db.select(Planet.id).filter_by(name="Alderaan")).one()
+    assert homeworlds == {"Luke Skywalker": tatooine.id, "Leia Organa": alderaan, "Nobody": None}
+
+
+def test_partial_upsert_keeps_missing_fields(app, tmp_path):
+    import_swapi(app, tmp_path, "--planets", write(tmp_path, "planets.json", [
+        {"name": "Tatooine", "climate": "arid", "terrain": "desert", "diameter": "10465"},
+    ]))
+    import_swapi(app, tmp_path, "--characters", write(tmp_path, "people.json", [
+        {"name": "Luke Skywalker", "gender": "male", "homeworld": "Tatooine"},
+    ]))
+
+    output = import_swapi(app, tmp_path, "--upsert", "--planets", write(tmp_path, "patch.json", [
+        {"name": "Tatooine", "climate": "hot"},
+        {"name": "Hoth", "climate": "frozen"},
+    ]), "--characters", write(tmp_path, "patch-people.json", [
+        {"name": "Luke Skywalker", "eye_color": "blue"},
+    ]))
+
+    assert "1 inserted, 1 updated" in output
+    tatooine = db.session.scalars(db.select(Planet).filter_by(name="Tatooine")).one()
+    assert (tatooine.climate, tatooine.terrain, tatooine.diameter, tatooine.diameter_num) == ("hot", "desert", "10465", 10465)
+    hoth = db.session.scalars(db.select(Planet).filter_by(name="Hoth")).one()
+    assert (hoth.climate, hoth.diameter) == ("frozen", None)
+    luke = db.session.scalars(db.select(Character).filter_by(name="Luke Skywalker")).one()
+    assert (luke.gender, luke.eye_color, luke.planet_id) == ("male", "blue", tatooine.id)
+
+
+def test_upsert_without_flag_skips(app, tmp_path):
+    planets = write(tmp_path, "planets.json", [{"name": "Tatooine", "climate": "arid"}])
+    import_swapi(app, tmp_path, "--planets", planets)
+    output = import_swapi(app, tmp_path, "--planets", write(tmp_path, "again.json", [{"name": "Tatooine", "climate": "hot"}]))
+
+    assert "0 inserted, 0 updated, 1 skipped" in output
+    assert db.session.scalars(db.select(Planet.climate)).one() == "arid"
+
+
+def test_invalid_records(app, tmp_path):
+    output = import_swapi(app, tmp_path, "--planets", write(tmp_path, "planets.json", [
+        {"name": "Tatooine", "diameter": 10465},
+        {"climate": "arid"},
+        "Alderaan",
+        {"name": "Hoth"},
+    ]))
+
+    assert "1 inserted, 0 updated, 0 skipped, 3 invalid" in output
+    assert db.session.scalars(db.select(Planet.name)).all() == ["Hoth"]
+
+
+def test_resume_from_state_file(app, tmp_path):
+    planets = write(tmp_path, "planets.json", [{"name": "Planet %d" % i} for i in range(5)])
+    state = tmp_path / "resume.json"
+    ImportState(str(state), restart=True).advance(planets, 3)
+
+    result = app.test_cli_runner().invoke(args=["import-swapi", "--state-file", str(state), "--planets", planets])
+
+    assert result.exit_code == 0, result.output
+    assert "resuming after 3 records" in result.output
+    assert db.session.scalars(db.select(Planet.name).order_by(Planet.id)).all() == ["Planet 3", "Planet 4"]
+    assert ImportState(str(state), restart=False).done(planets) == 5
@@ -0,0 +1,33 @@
+import pytest
+
+from models import parse_number
+
+
+@pytest.mark.parametrize("value, number", [
+    ("1,358", 1358.0),
+    ("200000", 200000.0),
+    ("1.5e3", 1500.0),
+    ("unknown", None),
+    ("30-165", None),
+    (None, None),
+    ("nan", None),
+    ("inf", None),
+    ("-Infinity", None),
+])
+def test_parse_number(value, number):
+    assert parse_number(value) == number
+
+
+def test_range_filters_reject_non_finite_bounds(client):
+    assert client.get("/planets?diameter_gt=nan").status_code == 400
+    assert client.get("/planets?diameter_lt=inf").status_code == 400
+
+
+def test_serialize_matches_serialized_columns(app):
+    from models import User, Planet, Character, serialized_columns
+    user = User(id=1, email="a@example.com", user_name="a", password="secret", is_active=True)
+    assert user.serialize() == {"id": 1, "email": "a@example.com", "user_name": "a", "is_active": True}
+    luke = Character(id=2, name="Luke", planet_id=1)
+    assert list(luke.serialize()) == list(serialized_columns(Character))
+    assert luke.serialize()["planet"] == 1
+    assert "favorites_count" not in Planet(id=1, name="Hoth").serialize()
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import insert
+
+from models import db, Planet
+from utils import encode_cursor
+
+DIAMETERS = ["10465", None, "12500", "unknown", "4900", "10465", None, "7200"]
+
+
+@pytest.fixture
+def planets(app):
+    db.session.execute(insert(Planet), [
+        {"name": "Planet %d" % i, "diameter": diameter, "diameter_num": float(diameter) if diameter and diameter.isdigit() else None}
+        for i, diameter in enumerate(DIAMETERS)
+    ])
+    db.session.commit()
+
+
+def walk(client, path):
+    ids = []
+    while path:
+        body = client.get(path).get_json()
+        ids += [row["id"] for row in body["results"]]
+        path = body["next"] and path.split("&after=")[0] + "&after=" + body["next"]
+    return ids
+
+
+@pytest.mark.parametrize("sort, expected", [
+    # NULLs (and unparsable numbers) last, the id breaks ties
+    ("diameter", [5, 8, 1, 6, 3, 2, 4, 7]),
+    ("-diameter", [3, 1, 6, 8, 5, 2, 4, 7]),
+    ("name", [1, 2, 3, 4, 5, 6, 7, 8]),
+])
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+def test_pages_cover_nulls(client, planets, sort, expected, limit):
+    assert walk(client, "/planets?sort=%s&limit=%d" % (sort, limit)) == expected
+
+
+@pytest.mark.parametrize("sort, cursor", [
+    ("diameter", ["10465", 1]),
+    ("diameter", [True, 1]),
+    ("diameter", [10465, "1"]),
+    ("diameter", [10465, True]),
+    ("name", [1, 1]),
+    ("name", ["Planet 1"]),
+    (None, ["Planet 1", 1]),
+])
+def test_cursor_values_are_checked(client, planets, sort, cursor):
+    path = "/planets?limit=2&after=" + encode_cursor(cursor)
+    response = client.get(path + ("&sort=" + sort if sort else ""))
+    assert response.status_code == 400
+    assert response.get_json()["message"] == "Invalid cursor"
+
+
+def test_cursor_in_the_null_segment(client, planets):
+    body = client.get("/planets?sort=diameter&limit=2&after=" + encode_cursor([None, 2])).get_json()
+    assert [row["id"] for row in body["results"]] == [4, 7]
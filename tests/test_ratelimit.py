@@ -0,0 +1,50 @@
+import pytest
+
+from ratelimit import TokenBuckets, PROBES, client_key, parse_proxies
+
+
+@pytest.mark.parametrize("text, proxies", [("", 0), ("false", 0), ("true", 1), ("2", 2)])
+def test_parse_proxies(text, proxies):
+    assert parse_proxies(text) == proxies
+
+
+@pytest.mark.parametrize("proxies, forwarded, key", [
+    (0, "6.6.6.6", "ip:10.0.0.1"),
+    (1, "6.6.6.6, 1.2.3.4", "ip:1.2.3.4"),
+    (2, "6.6.6.6, 1.2.3.4, 10.0.0.2", "ip:1.2.3.4"),
+    # fewer entries than proxies: the header was not written by them
+    (2, "6.6.6.6", "ip:10.0.0.1"),
+])
+def test_client_key_behind_proxies(app, proxies, forwarded, key):
+    app.config["RATE_LIMIT_TRUST_PROXY"] = proxies
+    headers = {"X-Forwarded-For": forwarded}
+    with app.test_request_context("/planets", headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert client_key() == key
+
+
+def test_user_ids_share_the_client_bucket(app, client):
+    app.config["RATE_LIMIT_ENABLED"] = True
+    app.config["RATE_LIMIT_DEFAULT"] = (0.001, 2)
+
+    statuses = [client.get("/user/%d" % id).status_code for id in range(1, 4)]
+
+    assert statuses == [404, 404, 429]
+
+
+def test_colliding_keys_share_a_bucket(tmp_path):
+    # a single slot: every key collides
+    buckets = TokenBuckets(str(tmp_path / "buckets"), 1)
+    assert [buckets.take("a", 1, 2, now=100) for _ in range(2)] == [0, 0]
+    assert buckets.take("a", 1, 2, now=100) > 0
+    # another key gets the stored tokens, not a full bucket
+    assert buckets.take("b", 1, 2, now=100) > 0
+    assert buckets.take("b", 1, 2, now=101.5) == 0
+
+
+def test_keys_probe_free_slots(tmp_path):
+    buckets = TokenBuckets(str(tmp_path / "buckets"), PROBES)
+    keys = ["key %d" % i for i in range(PROBES)]
+    for key in keys:
+        assert buckets.take(key, 1, 1, now=100) == 0
+    for key in keys:
+        assert buckets.take(key, 1, 1, now=100) > 0
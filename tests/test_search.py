@@ -0,0 +1,36 @@
+from sqlalchemy import insert
+
+from models import db, Planet, Character
+from search import _like_statement
+
+
+def seed():
+    db.session.execute(insert(Planet), [
+        {"name": "Tatooine", "climate": "arid", "terrain": "desert"},
+        {"name": "Hoth", "climate": "frozen", "terrain": "tundra, ice caves"},
+        {"name": "Arid 100%", "climate": "arid", "terrain": "desert"},
+    ])
+    db.session.execute(insert(Character), [{"name": "Luke Skywalker", "skin_color": "fair"}])
+    db.session.commit()
+
+
+def test_search_on_a_create_all_database(app, client):
+    seed()
+    response = client.get("/search?q=tatoo")
+    assert response.status_code == 200
+    assert [(row["type"], row["name"]) for row in response.get_json()["results"]] == [("planet", "Tatooine")]
+    # the triggers keep the index up to date
+    db.session.execute(insert(Planet), [{"name": "Tatooine II"}])
+    db.session.commit()
+    assert len(client.get("/search?q=tatooine&type=planet").get_json()["results"]) == 2
+
+
+def test_like_fallback(app):
+    seed()
+    rows = db.session.execute(_like_statement(["arid"], ["planet", "character"], 10, 0)).all()
+    # "Arid 100%" matches on its name and its climate
+    assert [(row.name, row.rank) for row in rows] == [("Arid 100%", 2), ("Tatooine", 1)]
+    # LIKE wildcards in the words are matched literally
+    assert db.session.execute(_like_statement(["d_s"], ["planet"], 10, 0)).all() == []
+    assert [row.name for row in db.session.execute(_like_statement(["sky", "FAIR"], ["planet", "character"], 10, 0))] == ["Luke Skywalker"]
+    assert [row.name for row in db.session.execute(_like_statement(["arid"], ["planet"], 1, 1))] == ["Tatooine"]
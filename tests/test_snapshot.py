@@ -0,0 +1,76 @@
+from sqlalchemy import insert
+
+from conftest import wait_for_snapshots
+from etags import bump_versions
+from models import db, Planet
+from snapshot import snapshots
+
+
+def seed(count):
+    db.session.execute(insert(Planet), [{"name": "Planet %d" % i, "climate": "arid"} for i in range(count)])
+    bump_versions(db.session.connection(), {"planet"})
+    db.session.commit()
+
+
+def served(client, path="/planets", **kwargs):
+    response = client.get(path, **kwargs)
+    assert response.status_code == 200
+    return response.headers.get("X-Catalog-Version")
+
+
+def test_built_in_the_background(app, client):
+    seed(3)
+    # the first request starts the build and is answered by the view
+    assert served(client) is None
+    wait_for_snapshots()
+    assert served(client) == "1"
+    assert [row["name"] for row in client.get("/planets").get_json()["results"]] == ["Planet 0", "Planet 1", "Planet 2"]
+
+
+def test_compressed_on_first_use(app, client):
+    app.config["COMPRESS_MIN_SIZE"] = 0
+    seed(3)
+    served(client)
+    wait_for_snapshots()
+    state = snapshots["planet"].current()
+
+    served(client)
+    assert state.compressed == {}
+    response = client.get("/planets", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert list(state.compressed) == [("first", "gzip")]
+
+
+def test_own_writes_are_patched(app, client):
+    app.config["DEFAULT_PAGE_SIZE"] = 2
+    seed(3)
+    served(client)
+    wait_for_snapshots()
+    served(client)
+    state = snapshots["planet"].current()
+
+    response = client.post("/planets", json=[{"name": "Hoth"}])
+    assert response.status_code in (200, 201), response.get_json()
+    assert served(client, "/planets?all=true") == "2"
+    patched = snapshots["planet"].current()
+    # the new row comes after the first page, its body is reused
+    assert patched is not state and patched.bodies["first"] is state.bodies["first"]
+    assert [row["name"] for row in client.get("/planets?all=true").get_json()["results"]][-1] == "Hoth"
+
+
+def test_other_writers_trigger_a_rebuild(app, client):
+    seed(3)
+    served(client)
+    wait_for_snapshots()
+    app.config["SNAPSHOT_CHECK_INTERVAL"] = 0
+
+    # another worker's write: a new version this process did not mark
+    db.session.execute(insert(Planet), [{"name": "Dagobah"}])
+    bump_versions(db.session.connection(), {"planet"})
+    db.session.commit()
+
+    response = client.get("/planets?all=true")
+    assert response.headers.get("X-Catalog-Version") is None
+    assert [row["name"] for row in response.get_json()["results"]][-1] == "Dagobah"
+    wait_for_snapshots()
+    assert served(client) == "2"